@@ -4,15 +4,111 @@ LangChain CoreのFunction Callingを使用
 ベクトルストア検索機能付き
 """
 
+import asyncio
+import hashlib
 import os
 import logging
+import re
+from typing import AsyncIterator, Dict, List, Tuple
+import orjson
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from api.tools import get_exchange_rates, get_specific_exchange_rate
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from api.tools import ExchangeRateError, get_exchange_rates, get_specific_exchange_rate, prefetch_rates
 from api.vector_store import vector_store_service
+from api.semantic_cache import SemanticResponseCache
 
 logger = logging.getLogger(__name__)
 
+# システムプロンプト（参考情報あり）
+# リクエスト間でバイト列が変わらない固定の先頭部分とし、プロバイダ側のプロンプトキャッシュを効かせる
+SYSTEM_PROMPT_WITH_CONTEXT = """あなたは親切で知識豊富な日本語チャットボットです。
+
+設定されたWebページの内容に基づいて質問に回答してください。
+参考情報が提供されている場合は、その情報を活用して回答してください。
+参考情報で回答できない場合や、為替・通貨に関する質問の場合は、適切なツールを使用してください。
+
+利用可能なツール:
+- get_exchange_rates: 主要通貨ペアの為替レートを取得
+- get_specific_exchange_rate: 特定通貨ペアの為替レートを取得
+
+常に日本語で回答してください。"""
+
+# システムプロンプト（参考情報なし）
+SYSTEM_PROMPT_WITHOUT_CONTEXT = """あなたは親切で知識豊富な日本語チャットボットです。
+
+このチャットボットは主に為替レート情報を提供することに特化しています。
+
+利用可能なツール:
+- get_exchange_rates: 主要通貨ペアの為替レートを取得
+- get_specific_exchange_rate: 特定通貨ペアの為替レートを取得
+
+為替、通貨、レートに関する質問の場合は、適切なツールを使用して最新のデータを取得してください。
+為替関連以外の質問の場合は、丁寧にお断りし、為替関連の質問をお待ちしていることをお伝えください。
+
+常に日本語で回答してください。"""
+# 毎回同じオブジェクトを使い回すシステムメッセージ
+SYSTEM_MESSAGE_WITH_CONTEXT = SystemMessage(content=SYSTEM_PROMPT_WITH_CONTEXT)
+SYSTEM_MESSAGE_WITHOUT_CONTEXT = SystemMessage(content=SYSTEM_PROMPT_WITHOUT_CONTEXT)
+
+# ツール結果の要約・比較・解釈を求める表現（該当する場合はツール結果をLLMに渡して回答を生成）
+SYNTHESIS_PATTERN = re.compile("見通し|予想|予測|比較|比べ|なぜ|理由|べき|計算|換算|違い|分析|解説|説明|要約")
+
+# 為替に関する質問とみなす表現
+EXCHANGE_PATTERN = re.compile(
+    r"為替|レート|通貨|相場|外貨|円|ドル|ユーロ|ポンド|人民元|フラン|ランド|FX|forex|exchange|rate|currency"
+    r"|USD|JPY|EUR|GBP|AUD|NZD|CAD|CHF|CNY|ZAR|TRY|MXN",
+    re.IGNORECASE
+)
+
+# 通貨を表す表記（セマンティックキャッシュで別の通貨ペアの回答を返さないよう、一致を確認する）
+CURRENCY_PATTERN = re.compile(
+    r"円|ドル|ユーロ|ポンド|豪|人民元|フラン|ランド|リラ|ペソ"
+    r"|USD|JPY|EUR|GBP|AUD|NZD|CAD|CHF|CNY|ZAR|TRY|MXN",
+    re.IGNORECASE
+)
+
+# 参考情報がなく為替にも関係しない質問への定型応答
+OUT_OF_SCOPE_RESPONSE = "申し訳ございません。このチャットボットは為替レート情報の提供に特化しているため、その質問にはお答えできません。ドル円やユーロ円など、為替に関するご質問をお待ちしております。"
+
+# 初期化失敗時の応答
+INITIALIZATION_ERROR_MESSAGE = "申し訳ございません。システムの初期化中にエラーが発生しました。GEMINI_API_KEYが正しく設定されているか確認してください。"
+
+# 処理失敗時の応答
+PROCESSING_ERROR_MESSAGE = "申し訳ございません。処理中にエラーが発生しました。しばらく時間をおいてから再度お試しください。"
+
+# ツール実行失敗時にLLMへ渡す結果（例外の内容はユーザーに見せない）
+TOOL_ERROR_MESSAGE = "ツール実行中にエラーが発生しました。"
+
+
+def message_key(message: str) -> str:
+    """
+    メッセージに対応する回答を識別するキーを生成
+    参照中のURLが変わると回答も変わるため、URLもキーに含める
+    
+    Args:
+        message: ユーザーからのメッセージ
+        
+    Returns:
+        str: メッセージと参照中のURLのハッシュ値
+    """
+    digest = hashlib.blake2b(message.encode("utf-8"), digest_size=16)
+    for url in vector_store_service.get_current_urls():
+        digest.update(b"\0" + url.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def currency_tag(message: str) -> str:
+    """
+    メッセージ中の通貨表記からセマンティックキャッシュのタグを生成
+    
+    Args:
+        message: ユーザーからのメッセージ
+        
+    Returns:
+        str: 通貨表記を重複なく並べた文字列（通貨表記がなければ空文字列）
+    """
+    return "|".join(sorted({token.upper() for token in CURRENCY_PATTERN.findall(message)}))
+
 
 class FunctionCallingChatBot:
     """
@@ -26,6 +122,14 @@ class FunctionCallingChatBot:
             'get_specific_exchange_rate': get_specific_exchange_rate
         }
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        # 類似メッセージへの回答を再利用するキャッシュ
+        self.response_cache = SemanticResponseCache()
+        # 整形済みのツール結果をLLMを介さずそのまま回答として返すかどうか
+        self.direct_tool_answers = True
+        # 実行中のバックグラウンドタスク（完了前にGCされないよう参照を保持）
+        self._background_tasks: set = set()
+        # 処理中のメッセージのキー → 処理タスク（同一メッセージ・同一URLの同時リクエストで共有）
+        self._pending: Dict[str, asyncio.Task] = {}
         
         if not self.gemini_api_key:
             logger.error("GEMINI_API_KEY環境変数が設定されていません")
@@ -47,11 +151,20 @@ class FunctionCallingChatBot:
                 logger.info("FunctionCallingChatBot初期化完了")
                 
             except Exception as e:
-                logger.error(f"FunctionCallingChatBot初期化エラー: {e}")
+                logger.error("FunctionCallingChatBot初期化エラー: %s", e)
                 self.llm = None
                 self.llm_with_tools = None
     
-    def _execute_tool(self, tool_call: dict) -> str:
+    def _prefetch_rates_in_background(self) -> None:
+        """
+        為替レートの取得をバックグラウンドで開始
+        エンベディング・LLM呼び出しの間に取得が終わり、ツール実行時にはキャッシュから返せる
+        """
+        task = asyncio.create_task(asyncio.to_thread(prefetch_rates))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _execute_tool(self, tool_call: dict) -> Tuple[str, bool]:
         """
         ツール実行ヘルパーメソッド
         
@@ -59,7 +172,7 @@ class FunctionCallingChatBot:
             tool_call: ツール呼び出し情報
             
         Returns:
-            str: ツール実行結果
+            Tuple[str, bool]: (ツール実行結果, 実行に成功したかどうか)
         """
         try:
             tool_name = tool_call.get('name', '')
@@ -67,68 +180,39 @@ class FunctionCallingChatBot:
             
             if tool_name in self.TOOLS:
                 # 辞書マッピングを使用してツールを実行
+                # 同期ツールはLangChainがスレッドプールで実行するためイベントループを塞がない
                 if tool_name == 'get_exchange_rates':
-                    return self.TOOLS[tool_name].invoke({})
+                    return await self.TOOLS[tool_name].ainvoke({}), True
                 else:
-                    return self.TOOLS[tool_name].invoke(tool_args)
+                    return await self.TOOLS[tool_name].ainvoke(tool_args), True
             else:
-                return f"不明なツール: {tool_name}"
+                return f"不明なツール: {tool_name}", False
                 
-        except Exception as e:
-            logger.error(f"ツール実行エラー: {e}")
-            return f"ツール実行中にエラーが発生しました: {str(e)}"
-    
-    def _generate_search_query(self, message: str) -> str:
-        """
-        ユーザーメッセージからベクトル検索用クエリを生成
-        
-        Args:
-            message: ユーザーからのメッセージ
-            
-        Returns:
-            str: 検索クエリ
-        """
-        try:
-            if not self.llm:
-                return message
-            
-            query_prompt = f"""以下のユーザーメッセージから、ベクトル検索に適した検索クエリを生成してください。
-            
-ユーザーメッセージ: {message}
-
-検索クエリは以下の点を考慮してください:
-- 重要なキーワードを含む
-- 簡潔で明確
-- 検索しやすい形式
-
-検索クエリのみを返してください（説明不要）:"""
-            
-            response = self.llm.invoke([HumanMessage(content=query_prompt)])
-            return response.content.strip()
+        except ExchangeRateError as e:
+            # ユーザー向けの文言をそのままツール結果として渡す
+            logger.warning("為替レート取得失敗: %s", e)
+            return str(e), False
             
         except Exception as e:
-            logger.error(f"検索クエリ生成エラー: {e}")
-            return message
+            logger.error("ツール実行エラー: %s", e)
+            return TOOL_ERROR_MESSAGE, False
     
-    def _search_context_documents(self, message: str) -> list:
+    def _search_context_documents(self, query_embedding) -> list:
         """
         ベクトルストア検索でコンテキストドキュメントを取得
         
         Args:
-            message: ユーザーからのメッセージ
+            query_embedding: ユーザーメッセージのエンベディング（取得失敗時はNone）
             
         Returns:
             list: 検索されたドキュメントのリスト
         """
         context_documents = []
-        if vector_store_service.is_initialized():
-            # 検索クエリを生成
-            search_query = self._generate_search_query(message)
-            logger.info(f"生成された検索クエリ: {search_query}")
-            
-            # ベクトル検索を実行
-            context_documents = vector_store_service.search_documents(search_query, k=3)
-            logger.info(f"検索結果: {len(context_documents)}個のドキュメント")
+        if query_embedding is not None and vector_store_service.is_initialized():
+            # セマンティックキャッシュと同じエンベディングでベクトル検索を実行
+            # （LLMによる検索クエリ生成は行わず、ユーザーメッセージをそのまま使用）
+            context_documents = vector_store_service.search_documents_by_vector(query_embedding, k=3)
+            logger.info("検索結果: %s個のドキュメント", len(context_documents))
         
         return context_documents
     
@@ -145,114 +229,303 @@ class FunctionCallingChatBot:
         if not context_documents:
             return ""
         
-        context_text = "\n\n参考情報:\n"
-        for i, doc in enumerate(context_documents, 1):
-            context_text += f"{i}. {doc.page_content}\n"
-        context_text += "\n"
-        
-        return context_text
+        return "参考情報:\n" + "".join(
+            f"{i}. {doc.page_content}\n" for i, doc in enumerate(context_documents, 1)
+        )
     
-    def _create_system_message(self, has_context: bool) -> str:
+    def _create_system_message(self, has_context: bool) -> SystemMessage:
         """
-        システムメッセージを作成
+        システムメッセージを取得
         
         Args:
             has_context: コンテキスト情報があるかどうか
             
         Returns:
-            str: システムメッセージ
+            SystemMessage: 事前に構築済みのシステムメッセージ
         """
         if has_context:
-            return """あなたは親切で知識豊富な日本語チャットボットです。
-
-設定されたWebページの内容に基づいて質問に回答してください。
-参考情報が提供されている場合は、その情報を活用して回答してください。
-参考情報で回答できない場合や、為替・通貨に関する質問の場合は、適切なツールを使用してください。
-
-利用可能なツール:
-- get_exchange_rates: 主要通貨ペアの為替レートを取得
-- get_specific_exchange_rate: 特定通貨ペアの為替レートを取得
-
-常に日本語で回答してください。"""
-        else:
-            return """あなたは親切で知識豊富な日本語チャットボットです。
-
-このチャットボットは主に為替レート情報を提供することに特化しています。
-
-利用可能なツール:
-- get_exchange_rates: 主要通貨ペアの為替レートを取得
-- get_specific_exchange_rate: 特定通貨ペアの為替レートを取得
-
-為替、通貨、レートに関する質問の場合は、適切なツールを使用して最新のデータを取得してください。
-為替関連以外の質問の場合は、丁寧にお断りし、為替関連の質問をお待ちしていることをお伝えください。
-
-常に日本語で回答してください。"""
+            return SYSTEM_MESSAGE_WITH_CONTEXT
+        return SYSTEM_MESSAGE_WITHOUT_CONTEXT
     
-    def _handle_tool_calls(self, messages: list, response) -> str:
+    def _build_messages(self, message: str, context_documents: list) -> list:
         """
-        ツール呼び出しを処理して最終回答を生成
+        LLMに渡すメッセージリストを構築
+        
+        Args:
+            message: ユーザーからのメッセージ
+            context_documents: 検索されたドキュメントのリスト
+            
+        Returns:
+            list: メッセージのリスト
+        """
+        # コンテキスト情報を構築
+        context_text = self._build_context_text(context_documents)
+        
+        # 固定のシステムプロンプト → 検索コンテキスト → ユーザーメッセージの順に並べ、
+        # 先頭部分をリクエスト間で同一に保つ
+        messages = [self._create_system_message(bool(context_documents))]
+        if context_text:
+            messages.append(SystemMessage(content=context_text))
+        messages.append(HumanMessage(content=message))
+        
+        return messages
+    
+    async def _append_tool_results(self, messages: list, response) -> Tuple[List[str], bool]:
+        """
+        ツール呼び出しを実行し、結果をメッセージ履歴に追加
         
         Args:
             messages: メッセージ履歴のリスト
-            response: LLMからの初回レスポンス
+            response: ツール呼び出しを含むLLMからのレスポンス
             
         Returns:
-            str: 最終回答
+            Tuple[List[str], bool]: (重複を除いた呼び出しごとのツール結果, 全てのツール呼び出しが成功したかどうか)
         """
         # メッセージ履歴にAIレスポンスを追加
         messages.append(response)
         
-        # 各ツールを実行
+        # 同じツール名・引数の呼び出しは1回だけ実行する
+        unique_calls = {}
+        call_keys = []
         for tool_call in response.tool_calls:
-            tool_result = self._execute_tool(tool_call)
-            
-            # ツール結果をメッセージ履歴に追加
+            key = (
+                tool_call.get('name'),
+                orjson.dumps(tool_call.get('args', {}), option=orjson.OPT_SORT_KEYS)
+            )
+            unique_calls.setdefault(key, tool_call)
+            call_keys.append(key)
+        
+        # 異なるツール呼び出しは並行して実行
+        results = await asyncio.gather(*(self._execute_tool(tool_call) for tool_call in unique_calls.values()))
+        results_by_key = dict(zip(unique_calls.keys(), results))
+        
+        # モデルが出力した各ツール呼び出しに対応する結果をメッセージ履歴に追加
+        for tool_call, key in zip(response.tool_calls, call_keys):
             messages.append(ToolMessage(
-                content=tool_result,
+                content=results_by_key[key][0],
                 tool_call_id=tool_call.get('id', 'unknown')
             ))
         
+        return [content for content, _ in results], all(succeeded for _, succeeded in results)
+    
+    def _is_exchange_query(self, message: str) -> bool:
+        """
+        為替に関する質問か判定
+        
+        Args:
+            message: ユーザーからのメッセージ
+            
+        Returns:
+            bool: 為替に関する質問の場合True
+        """
+        return EXCHANGE_PATTERN.search(message) is not None
+    
+    def _is_direct_tool_answer(self, message: str, response) -> bool:
+        """
+        ツール結果をそのまま回答にできるか判定
+        
+        呼び出された全てのツールがreturn_directで、ユーザーメッセージが
+        ツール結果の解釈を求めていない場合にTrue
+        
+        Args:
+            message: ユーザーからのメッセージ
+            response: ツール呼び出しを含むLLMからのレスポンス
+            
+        Returns:
+            bool: ツール結果をそのまま返す場合True
+        """
+        if not self.direct_tool_answers or SYNTHESIS_PATTERN.search(message):
+            return False
+        
+        return all(
+            getattr(self.TOOLS.get(tool_call.get('name')), 'return_direct', False)
+            for tool_call in response.tool_calls
+        )
+    
+    @staticmethod
+    def _join_tool_results(results: List[str]) -> str:
+        """重複を除いたツール結果を連結"""
+        return "\n\n".join(str(result) for result in results)
+    
+    async def _handle_tool_calls(self, messages: list, response, message: str = "") -> Tuple[str, bool]:
+        """
+        ツール呼び出しを処理して最終回答を生成
+        
+        Args:
+            messages: メッセージ履歴のリスト
+            response: LLMからの初回レスポンス
+            message: ユーザーからのメッセージ
+            
+        Returns:
+            Tuple[str, bool]: (最終回答, 全てのツール呼び出しが成功したかどうか)
+        """
+        results, succeeded = await self._append_tool_results(messages, response)
+        
+        # 整形済みのツール結果で回答が完結する場合は2回目のLLM呼び出しを省略
+        # （失敗した場合はエラー文言をそのまま返さず、LLMに回答を組み立てさせる）
+        if succeeded and self._is_direct_tool_answer(message, response):
+            return self._join_tool_results(results), True
+        
         # ツール結果を含めて最終回答を生成
-        final_response = self.llm.invoke(messages)
-        return final_response.content
+        final_response = await self.llm.ainvoke(messages)
+        return final_response.content, succeeded
 
-    def process_message(self, message: str) -> str:
+    async def process_message(self, message: str) -> Tuple[str, bool]:
         """
         ベクトル検索とFunction Callingを使用してメッセージを処理
+        同じURLを参照中に同じメッセージが処理中の場合は新たにLLMを呼ばず、実行中の処理の結果を共有する
         
         Args:
             message: ユーザーからのメッセージ
             
         Returns:
-            str: AIからのレスポンス
+            Tuple[str, bool]: (AIからのレスポンス, キャッシュしてよいかどうか)。
+                初期化・処理・ツール実行の失敗による一時的な回答はFalse
+        """
+        key = message_key(message)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._process_message(message))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        
+        # 1つのリクエストがキャンセルされても、共有している他のリクエストの処理は継続させる
+        return await asyncio.shield(task)
+
+    async def _process_message(self, message: str) -> Tuple[str, bool]:
+        """
+        ベクトル検索とFunction Callingを使用してメッセージを処理（process_messageの本体）
+        
+        Args:
+            message: ユーザーからのメッセージ
+            
+        Returns:
+            Tuple[str, bool]: (AIからのレスポンス, キャッシュしてよいかどうか)
         """
         try:
             if not self.llm_with_tools:
-                return "申し訳ございません。システムの初期化中にエラーが発生しました。GEMINI_API_KEYが正しく設定されているか確認してください。"
+                return INITIALIZATION_ERROR_MESSAGE, False
             
-            # ベクトルストア検索でコンテキストドキュメントを取得
-            context_documents = self._search_context_documents(message)
+            # 参考情報を参照できず為替にも関係しない質問は、LLMを呼ばずに定型文で断る
+            is_exchange_query = self._is_exchange_query(message)
+            if not vector_store_service.is_initialized() and not is_exchange_query:
+                return OUT_OF_SCOPE_RESPONSE, True
             
-            # コンテキスト情報を構築
-            context_text = self._build_context_text(context_documents)
+            # 類似メッセージ（通貨表記が一致するもの）への回答がキャッシュにあればLLM呼び出しを省略
+            tag = currency_tag(message)
+            query_embedding = await asyncio.to_thread(vector_store_service.embed_query, message)
+            if query_embedding is not None:
+                cached_response = self.response_cache.lookup(query_embedding, tag)
+                if cached_response is not None:
+                    logger.info("セマンティックキャッシュヒット")
+                    return cached_response, True
             
-            # システムメッセージを作成
-            system_message = self._create_system_message(bool(context_documents))
+            # キャッシュミスした為替の質問は、ツール呼び出しを待たずにレートの取得を始めておく
+            if is_exchange_query:
+                self._prefetch_rates_in_background()
             
-            # 初回のLLM呼び出し（ツール付き）
-            messages = [
-                HumanMessage(content=f"{system_message}\n\n{context_text}ユーザーの質問: {message}")
-            ]
+            # ベクトルストア検索でコンテキストドキュメントを取得
+            # 検索して該当がなかった場合のみ定型文で断る
+            # （エンベディング取得に失敗した場合は検索できていないため、参考情報なしでLLMに回答させる）
+            context_documents = self._search_context_documents(query_embedding)
+            if not context_documents and not is_exchange_query and query_embedding is not None:
+                return OUT_OF_SCOPE_RESPONSE, True
             
-            response = self.llm_with_tools.invoke(messages)
+            messages = self._build_messages(message, context_documents)
+            
+            # 初回のLLM呼び出し（ツール付き）
+            response = await self.llm_with_tools.ainvoke(messages)
             
             # ツール呼び出しがあるかチェック
-            if hasattr(response, 'tool_calls') and response.tool_calls:
-                return self._handle_tool_calls(messages, response)
+            tools_succeeded = True
+            used_tools = bool(getattr(response, 'tool_calls', None))
+            if used_tools:
+                answer, tools_succeeded = await self._handle_tool_calls(messages, response, message)
+            else:
+                # ツール呼び出しがない場合は直接回答
+                answer = response.content
+            
+            # ツール結果（取得時点の為替レート）を含む回答は、類似した別の質問に返さないようセマンティックキャッシュに入れない
+            if query_embedding is not None and not used_tools:
+                self.response_cache.store(query_embedding, answer, tag)
+            
+            # エンベディング取得に失敗した場合も参考情報なしの一時的な回答のため、共有キャッシュに保存させない
+            return answer, tools_succeeded and query_embedding is not None
+                
+        except Exception as e:
+            logger.error("メッセージ処理エラー: %s", e)
+            return PROCESSING_ERROR_MESSAGE, False
+
+    async def stream_message(self, message: str) -> AsyncIterator[str]:
+        """
+        メッセージを処理し、回答をトークン単位で順次返す
+        
+        Args:
+            message: ユーザーからのメッセージ
+            
+        Yields:
+            str: AIからのレスポンスの断片
+        """
+        try:
+            if not self.llm_with_tools:
+                yield INITIALIZATION_ERROR_MESSAGE
+                return
+            
+            is_exchange_query = self._is_exchange_query(message)
+            if not vector_store_service.is_initialized() and not is_exchange_query:
+                yield OUT_OF_SCOPE_RESPONSE
+                return
+            
+            # 類似メッセージ（通貨表記が一致するもの）への回答がキャッシュにあればまとめて返す
+            tag = currency_tag(message)
+            query_embedding = await asyncio.to_thread(vector_store_service.embed_query, message)
+            if query_embedding is not None:
+                cached_response = self.response_cache.lookup(query_embedding, tag)
+                if cached_response is not None:
+                    logger.info("セマンティックキャッシュヒット")
+                    yield cached_response
+                    return
+            
+            if is_exchange_query:
+                self._prefetch_rates_in_background()
+            
+            context_documents = self._search_context_documents(query_embedding)
+            if not context_documents and not is_exchange_query and query_embedding is not None:
+                yield OUT_OF_SCOPE_RESPONSE
+                return
+            
+            messages = self._build_messages(message, context_documents)
+            
+            # 初回のLLM呼び出し（ツール付き）
+            # テキストはそのまま送出し、ツール呼び出しのチャンクは結合して後で実行する
+            parts = []
+            response = None
+            async for chunk in self.llm_with_tools.astream(messages):
+                response = chunk if response is None else response + chunk
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            
+            used_tools = response is not None and bool(response.tool_calls)
+            if used_tools:
+                tool_results, tools_succeeded = await self._append_tool_results(messages, response)
+                
+                if tools_succeeded and self._is_direct_tool_answer(message, response):
+                    # 整形済みのツール結果をそのまま送出
+                    tool_answer = self._join_tool_results(tool_results)
+                    parts.append(tool_answer)
+                    yield tool_answer
+                else:
+                    # ツール結果を含めた最終回答をストリーミング
+                    async for chunk in self.llm.astream(messages):
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield chunk.content
             
-            # ツール呼び出しがない場合は直接回答
-            return response.content
+            # ツール結果を含む回答はセマンティックキャッシュに入れない
+            if query_embedding is not None and parts and not used_tools:
+                self.response_cache.store(query_embedding, "".join(parts), tag)
                 
         except Exception as e:
-            logger.error(f"メッセージ処理エラー: {e}")
-            return "申し訳ございません。処理中にエラーが発生しました。しばらく時間をおいてから再度お試しください。"
\ No newline at end of file
+            logger.error("ストリーミング処理エラー: %s", e)
+            yield PROCESSING_ERROR_MESSAGE
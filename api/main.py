@@ -3,26 +3,242 @@ FastAPIルーティング
 エンドポイント定義とミドルウェア設定
 """
 
+from contextlib import asynccontextmanager, contextmanager, suppress
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+import asyncio
+import atexit
 import logging
 import os
+import queue
+import time
+import orjson
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from api.models import ChatRequest, ChatResponse, ToolsResponse, HealthResponse, ToolInfo
-from api.bot import FunctionCallingChatBot
+from api.bot import FunctionCallingChatBot, message_key
+from api.redis_store import get_redis
+from api.tools import prefetch_rates, close_session
 from api.vector_store import vector_store_service
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict
+from typing import Callable, Optional, List
 
 # ログ設定
-logging.basicConfig(level=logging.INFO)
+# 標準エラー出力への書き込みはQueueListenerのスレッドで行い、ログ出力でイベントループを塞がない
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Redisに保存するチャット回答のキー接頭辞
+REDIS_CHAT_KEY_PREFIX = "chat:"
+
+# チャット回答の共有キャッシュ有効期間（秒）。為替レートを含む回答が古くならないよう短めに設定
+CHAT_CACHE_TTL = 30.0
+
+# 同時に処理するチャットリクエストの上限（超えた分はキューに溜めず429を返し、待ち時間の増大を防ぐ）
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "50"))
+
+# 処理中・拒否したチャットリクエスト数（イベントループ内でのみ更新するためロック不要）
+_active_chats = 0
+_rejected_chats = 0
+
+# 秒単位でキャッシュしたタイムスタンプ: (UNIX秒, ISO形式文字列)
+_timestamp_cache = (0, "")
+
+
+def current_timestamp() -> str:
+    """
+    現在時刻のISO形式文字列を取得
+    同じ秒の間はフォーマット済みの文字列を再利用する
+    
+    Returns:
+        str: ISO形式のタイムスタンプ（秒精度）
+    """
+    global _timestamp_cache
+    
+    now = int(time.time())
+    cached_second, cached_value = _timestamp_cache
+    if now != cached_second:
+        cached_value = datetime.fromtimestamp(now).isoformat()
+        _timestamp_cache = (now, cached_value)
+    
+    return cached_value
+
+
+def _chat_cache_key(message: str) -> str:
+    """
+    メッセージに対応する共有キャッシュのキーを生成
+    参照中のURLが変わると回答も変わるため、URLもキーに含める
+    
+    Args:
+        message: ユーザーからのメッセージ
+        
+    Returns:
+        str: Redisのキー
+    """
+    return REDIS_CHAT_KEY_PREFIX + message_key(message)
+
+
+def _load_cached_chat(key: str) -> Optional[bytes]:
+    """
+    Redisからエンコード済みの回答を取得
+    
+    Args:
+        key: Redisのキー
+        
+    Returns:
+        Optional[bytes]: JSONエンコード済みの回答文字列。未保存またはRedis未使用時はNone
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    
+    try:
+        return client.get(key)
+        
+    except Exception as e:
+        logger.warning("Redisからのチャット回答取得エラー: %s", e)
+        return None
+
+
+def _store_cached_chat(key: str, encoded_response: bytes) -> None:
+    """
+    エンコード済みの回答をRedisに保存（Redis未使用時は何もしない）
+    
+    Args:
+        key: Redisのキー
+        encoded_response: JSONエンコード済みの回答文字列
+    """
+    client = get_redis()
+    if client is None:
+        return
+    
+    try:
+        client.set(key, encoded_response, px=int(CHAT_CACHE_TTL * 1000))
+        
+    except Exception as e:
+        logger.warning("Redisへのチャット回答保存エラー: %s", e)
+
+
+def _chat_response_body(encoded_response: bytes) -> bytes:
+    """
+    エンコード済みの回答に現在のタイムスタンプを付けてレスポンスボディを組み立てる
+    
+    Args:
+        encoded_response: JSONエンコード済みの回答文字列
+        
+    Returns:
+        bytes: ChatResponse形式のJSON
+    """
+    return b'{"response":' + encoded_response + b',"timestamp":"' + current_timestamp().encode() + b'"}'
+
+
+def _reject_if_busy() -> None:
+    """
+    処理中のチャットリクエストが上限に達していれば429を返す
+    
+    Raises:
+        HTTPException: 上限に達している場合（status_code=429）
+    """
+    global _rejected_chats
+    
+    if _active_chats >= MAX_CONCURRENT_CHATS:
+        _rejected_chats += 1
+        raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": "1"})
+
+
+def _acquire_chat_slot() -> Callable[[], None]:
+    """
+    チャットリクエストを処理中リクエスト数に計上する
+    
+    Returns:
+        Callable[[], None]: 計上を戻す関数（複数回呼ばれても1回だけ戻す）
+    """
+    global _active_chats
+    
+    _active_chats += 1
+    released = False
+    
+    def release() -> None:
+        global _active_chats
+        nonlocal released
+        
+        if not released:
+            released = True
+            _active_chats -= 1
+    
+    return release
+
+
+@contextmanager
+def _chat_slot():
+    """チャットリクエストの処理中、処理中リクエスト数に計上する"""
+    release = _acquire_chat_slot()
+    try:
+        yield
+    finally:
+        release()
+
+
+class _EventStreamPassthroughGZipResponder(GZipResponder):
+    """text/event-streamのレスポンスだけは圧縮せずにそのまま送信するGZipResponder"""
+    
+    async def send_with_gzip(self, message: Message) -> None:
+        await super().send_with_gzip(message)
+        
+        # 圧縮するとSSEの断片がバッファされて逐次送信されないため、
+        # Content-Encoding設定済みのレスポンスと同じくボディを加工せずに送る
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.startswith("text/event-stream"):
+                self.content_encoding_set = True
+
+
+class EventStreamAwareGZipMiddleware(GZipMiddleware):
+    """text/event-stream以外のレスポンスをgzip圧縮するミドルウェア"""
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _EventStreamPassthroughGZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    アプリケーションのライフサイクル管理
+    起動時に為替レートの先読みを始め、終了時にHTTPセッションを閉じる
+    """
+    # 先読みは任意の準備処理のため、為替APIの応答を待たずに起動を完了させる
+    prefetch_task = asyncio.create_task(asyncio.to_thread(prefetch_rates))
+    yield
+    prefetch_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await prefetch_task
+    close_session()
+    vector_store_service.close()
+    logger.info("HTTPセッションを閉じました")
+
+
 # FastAPIアプリケーション設定
 app = FastAPI(
     title="ChatBot API",
     description="LangChain Function Calling対応チャットボット",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS設定（VERCEL_ENV環境変数が存在する場合は無効化）
@@ -35,20 +251,54 @@ if not os.getenv("VERCEL_ENV"):
         allow_headers=["*"],
     )
 
+# 日本語の長い回答は圧縮効果が大きいため、500バイト以上のレスポンスをgzip圧縮する（SSEは除く）
+app.add_middleware(EventStreamAwareGZipMiddleware, minimum_size=500, compresslevel=6)
+
 # グローバルチャットボットインスタンス
 chatbot = FunctionCallingChatBot()
 
+# ツール一覧は固定のため、起動時に一度だけシリアライズしておく
+TOOLS_RESPONSE_BYTES = orjson.dumps(ToolsResponse(tools=[
+    ToolInfo(
+        name="get_exchange_rates",
+        description="GMO Coin APIから主要通貨ペアの為替レート情報を取得"
+    ),
+    ToolInfo(
+        name="get_specific_exchange_rate",
+        description="GMO Coin APIから特定通貨ペアの為替レート情報を取得"
+    ),
+    ToolInfo(
+        name="ChatGoogleGenerativeAI",
+        description="LangChain経由でGoogle Gemini APIによる自然言語処理"
+    )
+]).model_dump())
+
+# ヘルスチェックの内容も固定のため、起動時に一度だけシリアライズしておく
+HEALTH_RESPONSE_BYTES = orjson.dumps(HealthResponse(
+    message="ChatBot API is running with Function Calling",
+    status="ok"
+).model_dump())
+
 # リクエストモデル
 class SetUrlRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
     urls: List[str]
 
 class SetUrlResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
     success: bool
     message: str
     urls: Optional[List[str]] = None
     failed_urls: Optional[List[str]] = None
 
+class MetricsResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    active_chats: int
+    max_concurrent_chats: int
+    rejected_chats: int
+
 class ClearVectorStoreResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
     success: bool
     message: str
 
@@ -56,10 +306,7 @@ class ClearVectorStoreResponse(BaseModel):
 @app.get("/", response_model=HealthResponse)
 async def root():
     """ヘルスチェックエンドポイント"""
-    return HealthResponse(
-        message="ChatBot API is running with Function Calling", 
-        status="ok"
-    )
+    return Response(content=HEALTH_RESPONSE_BYTES, media_type="application/json")
 
 
 @app.post("/api/chat", response_model=ChatResponse)
@@ -74,42 +321,101 @@ async def chat(request: ChatRequest):
         ChatResponse: チャットレスポンス
     """
     try:
-        logger.info(f"受信メッセージ: {request.message}")
+        logger.info("受信メッセージ: %s", request.message)
+        
+        # 同一メッセージの回答が共有キャッシュにあれば、エンコード済みのまま返す
+        cache_key = None
+        if get_redis() is not None:
+            cache_key = _chat_cache_key(request.message)
+            cached = await asyncio.to_thread(_load_cached_chat, cache_key)
+            if cached is not None:
+                logger.info("チャット回答キャッシュヒット")
+                return Response(content=_chat_response_body(cached), media_type="application/json")
+        
+        # 処理中のリクエストが上限に達している場合は、待たせずに429を返す
+        _reject_if_busy()
         
         # チャットボットでメッセージを処理
-        response = chatbot.process_message(request.message)
+        # process_messageはブロックする処理（エンベディング・為替API）をスレッドで実行するため、
+        # 処理中も他のリクエストを並行して受け付けられる。同期I/Oを追加する場合もasyncio.to_threadで実行すること
+        with _chat_slot():
+            response, cacheable = await chatbot.process_message(request.message)
         
-        logger.info(f"送信レスポンス: {response}")
+        logger.info("送信レスポンス: %s", response)
         
-        return ChatResponse(
-            response=response,
-            timestamp=datetime.now().isoformat()
+        # レスポンスモデルの検証を省き、回答文字列を1回だけエンコードしてボディに埋め込む
+        encoded_response = orjson.dumps(response)
+        background = None
+        # 初期化・処理・ツール実行の失敗による一時的な回答は共有キャッシュに保存しない
+        if cache_key is not None and cacheable:
+            background = BackgroundTask(_store_cached_chat, cache_key, encoded_response)
+        
+        return Response(
+            content=_chat_response_body(encoded_response),
+            media_type="application/json",
+            background=background
         )
         
+    except HTTPException:
+        raise
+        
     except Exception as e:
-        logger.error(f"チャット処理エラー: {e}")
+        logger.error("チャット処理エラー: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    ストリーミングチャットエンドポイント（Server-Sent Events）
+    
+    回答の断片を `data: {"delta": "..."}` として順次送信し、
+    最後に `data: [DONE]` を送信する
+    
+    Args:
+        request: チャットリクエスト
+        
+    Returns:
+        StreamingResponse: text/event-streamレスポンス
+    """
+    logger.info("受信メッセージ（ストリーミング）: %s", request.message)
+    
+    _reject_if_busy()
+    
+    # レスポンスを返す前に計上し、送信開始までの間に上限を超えて受け付けないようにする
+    release_slot = _acquire_chat_slot()
+    
+    async def event_stream():
+        try:
+            async for delta in chatbot.stream_message(request.message):
+                yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+        finally:
+            release_slot()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # 送信を開始する前に切断された場合も、送信後のバックグラウンドタスクで計上を戻す
+        background=BackgroundTask(release_slot),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/tools", response_model=ToolsResponse)
 async def get_available_tools():
     """利用可能なツール一覧を取得"""
-    tools_info = [
-        ToolInfo(
-            name="get_exchange_rates",
-            description="GMO Coin APIから主要通貨ペアの為替レート情報を取得"
-        ),
-        ToolInfo(
-            name="get_specific_exchange_rate", 
-            description="GMO Coin APIから特定通貨ペアの為替レート情報を取得"
-        ),
-        ToolInfo(
-            name="ChatGoogleGenerativeAI",
-            description="LangChain経由でGoogle Gemini APIによる自然言語処理"
-        )
-    ]
-    
-    return ToolsResponse(tools=tools_info)
+    return Response(content=TOOLS_RESPONSE_BYTES, media_type="application/json")
+
+
+@app.get("/api/metrics", response_model=MetricsResponse)
+async def get_metrics():
+    """処理中・拒否したチャットリクエスト数を取得"""
+    return MetricsResponse(
+        active_chats=_active_chats,
+        max_concurrent_chats=MAX_CONCURRENT_CHATS,
+        rejected_chats=_rejected_chats
+    )
 
 
 @app.post("/api/set-url", response_model=SetUrlResponse)
@@ -124,7 +430,7 @@ async def set_url(request: SetUrlRequest):
         SetUrlResponse: 設定結果
     """
     try:
-        logger.info(f"複数URL設定開始: {len(request.urls)}個のURL")
+        logger.info("複数URL設定開始: %s個のURL", len(request.urls))
         
         # URLバリデーション
         invalid_urls = []
@@ -143,8 +449,14 @@ async def set_url(request: SetUrlRequest):
             vector_store_service.clear_vector_store()
             logger.info("既存のベクトルストアをクリアしました")
         
+        # 参照ドキュメントが変わるためキャッシュ済みの回答を破棄
+        chatbot.response_cache.clear()
+        
         # URLからドキュメントを読み込みベクトルストアを構築
-        successful_urls, failed_urls = vector_store_service.load_and_store_documents(request.urls)
+        # （HTML取得とエンベディングでブロックするため、イベントループを塞がないようスレッドで実行）
+        successful_urls, failed_urls = await asyncio.to_thread(
+            vector_store_service.load_and_store_documents, request.urls
+        )
         
         if successful_urls:
             if failed_urls:
@@ -168,7 +480,7 @@ async def set_url(request: SetUrlRequest):
             )
         
     except Exception as e:
-        logger.error(f"URL設定エラー: {e}")
+        logger.error("URL設定エラー: %s", e)
         return SetUrlResponse(
             success=False,
             message="URL設定中にエラーが発生しました。"
@@ -187,6 +499,7 @@ async def clear_vectorstore():
         logger.info("ベクトルストアクリア開始")
         
         success = vector_store_service.clear_vector_store()
+        chatbot.response_cache.clear()
         
         if success:
             return ClearVectorStoreResponse(
@@ -200,7 +513,7 @@ async def clear_vectorstore():
             )
         
     except Exception as e:
-        logger.error(f"ベクトルストアクリアエラー: {e}")
+        logger.error("ベクトルストアクリアエラー: %s", e)
         return ClearVectorStoreResponse(
             success=False,
             message="ベクトルストアクリア中にエラーが発生しました。"
@@ -226,7 +539,7 @@ async def get_vectorstore_status():
         }
         
     except Exception as e:
-        logger.error(f"ベクトルストア状態取得エラー: {e}")
+        logger.error("ベクトルストア状態取得エラー: %s", e)
         return {
             "initialized": False,
             "current_url": None,
@@ -236,4 +549,15 @@ async def get_vectorstore_status():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # ベクトルストア・セマンティックキャッシュ・同時処理数の上限はプロセスごとに持つため、既定は1ワーカーとする
+    # （複数ワーカーでは/api/set-urlで読み込んだドキュメントがリクエストを受けたワーカーにしか反映されない）
+    # WEB_CONCURRENCYで複数ワーカーを指定できるよう、アプリはインポート文字列で渡す
+    uvicorn.run(
+        "api.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level="warning"
+    )
\ No newline at end of file
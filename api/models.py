@@ -3,32 +3,42 @@ Pydanticモデル定義
 リクエスト/レスポンスの型定義
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ChatRequest(BaseModel):
     """チャットリクエストモデル"""
+    model_config = ConfigDict(frozen=True)
+
     message: str
 
 
 class ChatResponse(BaseModel):
     """チャットレスポンスモデル"""
+    model_config = ConfigDict(frozen=True)
+
     response: str
     timestamp: str
 
 
 class ToolInfo(BaseModel):
     """ツール情報モデル"""
+    model_config = ConfigDict(frozen=True)
+
     name: str
     description: str
 
 
 class ToolsResponse(BaseModel):
     """ツール一覧レスポンスモデル"""
+    model_config = ConfigDict(frozen=True)
+
     tools: list[ToolInfo]
 
 
 class HealthResponse(BaseModel):
     """ヘルスチェックレスポンスモデル"""
+    model_config = ConfigDict(frozen=True)
+
     message: str
     status: str
\ No newline at end of file
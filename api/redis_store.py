@@ -0,0 +1,62 @@
+"""
+Redisクライアント
+REDIS_URLが設定されている場合のみ、プロセス間で共有するキャッシュとして利用
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+import redis
+
+# ログ設定
+logger = logging.getLogger(__name__)
+
+_client: Optional[redis.Redis] = None
+_initialized = False
+_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    共有Redisクライアントを取得（初回呼び出し時に接続設定を作成）
+    
+    Returns:
+        Optional[redis.Redis]: Redisクライアント（REDIS_URL未設定または初期化失敗時はNone）
+    """
+    global _client, _initialized
+    
+    if _initialized:
+        return _client
+    
+    with _lock:
+        if not _initialized:
+            redis_url = os.getenv("REDIS_URL")
+            if redis_url:
+                try:
+                    # キャッシュ用途のため、Redisが遅い場合は待たずにAPIへフォールバックさせる
+                    _client = redis.Redis.from_url(
+                        redis_url,
+                        socket_timeout=0.5,
+                        socket_connect_timeout=0.5
+                    )
+                    logger.info("Redisクライアントを初期化しました")
+                    
+                except Exception as e:
+                    logger.error("Redisクライアント初期化エラー: %s", e)
+                    _client = None
+            _initialized = True
+    
+    return _client
+
+
+def reset_redis() -> None:
+    """Redisクライアントを破棄し、次回のget_redisで再初期化させる"""
+    global _client, _initialized
+    
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _initialized = False
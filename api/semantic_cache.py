@@ -0,0 +1,138 @@
+"""
+セマンティックレスポンスキャッシュ
+メッセージのエンベディング類似度でLLMの回答を再利用
+"""
+
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+# ログ設定
+logger = logging.getLogger(__name__)
+
+# int8量子化のスケール（正規化済みベクトルの各成分[-1, 1]を[-127, 127]に対応付ける）
+QUANTIZATION_SCALE = 127.0
+
+
+class SemanticResponseCache:
+    """
+    エンベディングのコサイン類似度で過去の回答を引き当てるキャッシュ
+    類似度が閾値以上でタグが一致するエントリがあればLLM呼び出しを省略できる
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 30.0, max_entries: int = 1000):
+        """
+        初期化
+
+        Args:
+            threshold: キャッシュヒットとみなすコサイン類似度の閾値
+            ttl: エントリの有効期間（秒）。為替レートを含む回答が古くならないよう短めに設定
+            max_entries: 保持する最大エントリ数（超えた場合は最も長く使われていないエントリを置き換える）
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """保持データを初期化（ロック取得済みまたは初期化中に呼び出すこと）"""
+        # int8量子化済みの正規化エンベディングを格納する連続領域（次元は初回登録時に確定）
+        self._matrix: Optional[np.ndarray] = None
+        self._responses: List[Optional[str]] = [None] * self.max_entries
+        # 類似度に関係なく一致が必要なタグ（要素ごとに比較できるようobject配列で持つ）
+        self._tags = np.full(self.max_entries, None, dtype=object)
+        self._stored_at = np.full(self.max_entries, -np.inf)
+        self._last_used = np.full(self.max_entries, -np.inf)
+        # 使用済みのスロット数（先頭から順に埋める）
+        self._size = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        """エンベディングをL2正規化（ゼロベクトルの場合はNone）"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    @staticmethod
+    def _quantize(vector: np.ndarray) -> np.ndarray:
+        """正規化済みベクトルをint8に量子化（保持メモリをfloat32の1/4に削減）"""
+        return np.round(vector * QUANTIZATION_SCALE).astype(np.int8)
+
+    def lookup(self, embedding: List[float], tag: str = "") -> Optional[str]:
+        """
+        類似したメッセージに対するキャッシュ済みの回答を検索
+
+        Args:
+            embedding: ユーザーメッセージのエンベディング
+            tag: 登録時と一致する必要があるタグ（例: メッセージ中の通貨表記）
+
+        Returns:
+            Optional[str]: キャッシュヒット時は回答、ミス時はNone
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            if self._size == 0 or self._matrix.shape[1] != query.shape[0]:
+                return None
+
+            now = time.monotonic()
+            size = self._size
+
+            # 連続領域に対する1回の行列ベクトル積で全エントリの類似度を計算
+            similarities = (self._matrix[:size] @ query) / QUANTIZATION_SCALE
+            similarities[now - self._stored_at[:size] >= self.ttl] = -np.inf
+            similarities[self._tags[:size] != tag] = -np.inf
+            best = int(np.argmax(similarities))
+            if float(similarities[best]) >= self.threshold:
+                self._last_used[best] = now
+                return self._responses[best]
+
+        return None
+
+    def store(self, embedding: List[float], response: str, tag: str = "") -> None:
+        """
+        回答をキャッシュに登録
+
+        Args:
+            embedding: ユーザーメッセージのエンベディング
+            response: LLMの回答
+            tag: 検索時に一致が必要なタグ
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            # エンベディングの次元が変わった場合（モデル変更等）は作り直す
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._reset()
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.int8)
+
+            now = time.monotonic()
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # 期限切れのスロットがあれば再利用し、なければ最も長く使われていないスロットを置き換える
+                expired = np.flatnonzero(now - self._stored_at >= self.ttl)
+                slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+
+            self._matrix[slot] = self._quantize(vector)
+            self._responses[slot] = response
+            self._tags[slot] = tag
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+
+    def clear(self) -> None:
+        """キャッシュを全て削除"""
+        with self._lock:
+            self._reset()
+        logger.info("セマンティックキャッシュをクリアしました")
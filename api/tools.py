@@ -3,23 +3,209 @@ LangChainツール定義
 為替レート取得機能
 """
 
+import orjson
 import requests
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional, Tuple
 import logging
+import threading
+import time
 from datetime import datetime
 from langchain_core.tools import tool
+from api.redis_store import get_redis
 
 logger = logging.getLogger(__name__)
 
+# GMOコイン為替APIのエンドポイント
+TICKER_API_URL = "https://forex-api.coin.z.com/public/v1/ticker"
+
+# ティッカーデータのキャッシュ有効期間（秒）
+RATES_CACHE_TTL = 2.0
+
+# 表示する主要通貨ペア（表示順）
+MAJOR_PAIRS = ('USD_JPY', 'EUR_JPY', 'GBP_JPY', 'AUD_JPY', 'EUR_USD')
+
+# 通貨ペアの日本語表記
+PAIR_NAMES = {
+    'USD_JPY': 'ドル/円',
+    'EUR_JPY': 'ユーロ/円',
+    'GBP_JPY': 'ポンド/円',
+    'AUD_JPY': '豪ドル/円',
+    'EUR_USD': 'ユーロ/ドル'
+}
+
+# TCP/TLS接続を再利用するHTTPセッション
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# URLごとのティッカーデータキャッシュ: {URL: (取得時刻, レスポンスJSON, シンボル別レート)}
+_RATES_CACHE: Dict[str, Tuple[float, Dict[str, Any], Dict[str, Dict[str, Any]]]] = {}
+_rates_lock = threading.Lock()
+
+# 秒単位でキャッシュした取得時刻の表示文字列: (UNIX秒, フォーマット済み文字列)
+_formatted_time_cache = (0, "")
+
+# Redisに保存するティッカーデータのキー接頭辞
+REDIS_RATES_KEY_PREFIX = "fx:ticker:"
+
+
+def _load_shared_rates(api_url: str, ttl: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+    """
+    Redisからティッカーデータを取得
+    
+    Args:
+        api_url: ティッカーAPIのURL
+        ttl: キャッシュ有効期間（秒）
+        
+    Returns:
+        Optional[Tuple[float, Dict[str, Any]]]: (取得時刻, レスポンスJSON)。未保存またはRedis未使用時はNone
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    
+    try:
+        key = REDIS_RATES_KEY_PREFIX + api_url
+        raw, remaining_ms = client.pipeline().get(key).pttl(key).execute()
+        if raw is None or remaining_ms <= 0:
+            return None
+        
+        # 残りTTLから取得時刻を逆算し、ローカルキャッシュでも同じ時刻に失効させる
+        fetched_at = time.monotonic() - (ttl - remaining_ms / 1000)
+        return fetched_at, orjson.loads(raw)
+        
+    except Exception as e:
+        logger.warning("Redisからの為替データ取得エラー: %s", e)
+        return None
+
+
+def _store_shared_rates(api_url: str, content: bytes, ttl: float) -> None:
+    """
+    ティッカーデータをRedisに保存
+    
+    Args:
+        api_url: ティッカーAPIのURL
+        content: APIレスポンスのJSONバイト列
+        ttl: キャッシュ有効期間（秒）
+    """
+    client = get_redis()
+    if client is None:
+        return
+    
+    try:
+        client.set(REDIS_RATES_KEY_PREFIX + api_url, content, px=int(ttl * 1000))
+        
+    except Exception as e:
+        logger.warning("Redisへの為替データ保存エラー: %s", e)
+
+
+def _fetch_rates(
+    api_url: str,
+    ttl: float = RATES_CACHE_TTL,
+    session: Optional[requests.Session] = None
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    ティッカーデータを取得（TTL内はキャッシュを返す）
+    
+    Args:
+        api_url: ティッカーAPIのURL
+        ttl: キャッシュ有効期間（秒）
+        session: API呼び出しに使うHTTPセッション（省略時はモジュール共有のセッション）
+        
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]: (レスポンスJSON, シンボル別レート)
+        
+    Raises:
+        requests.exceptions.RequestException: API呼び出しに失敗した場合
+    """
+    # 同時リクエストでもAPI呼び出しが1回で済むようロック内で取得する
+    with _rates_lock:
+        cached = _RATES_CACHE.get(api_url)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[1], cached[2]
+        
+        # 他のワーカー・インスタンスが取得済みのデータがあれば再利用する
+        shared = _load_shared_rates(api_url, ttl)
+        if shared is not None:
+            fetched_at, data = shared
+            by_symbol = {rate_info.get('symbol', ''): rate_info for rate_info in data.get('data', [])}
+            _RATES_CACHE[api_url] = (fetched_at, data, by_symbol)
+            return data, by_symbol
+        
+        response = (session or _session).get(api_url, timeout=10)
+        response.raise_for_status()
+        
+        data = orjson.loads(response.content)
+        by_symbol = {rate_info.get('symbol', ''): rate_info for rate_info in data.get('data', [])}
+        
+        # 正常なレスポンスのみキャッシュする
+        if data.get('status') == 0:
+            _RATES_CACHE[api_url] = (time.monotonic(), data, by_symbol)
+            _store_shared_rates(api_url, response.content, ttl)
+        
+        return data, by_symbol
+
+
+def _formatted_now() -> str:
+    """
+    現在時刻の表示用文字列を取得
+    同じ秒の間はフォーマット済みの文字列を再利用する
+    
+    Returns:
+        str: "%Y-%m-%d %H:%M:%S" 形式の現在時刻
+    """
+    global _formatted_time_cache
+    
+    now = int(time.time())
+    cached_second, cached_value = _formatted_time_cache
+    if now != cached_second:
+        cached_value = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        _formatted_time_cache = (now, cached_value)
+    
+    return cached_value
+
+
+def prefetch_rates() -> None:
+    """
+    ティッカーデータを先読みしてキャッシュとHTTP接続を温める
+    失敗してもアプリケーションの起動は継続する
+    """
+    try:
+        _fetch_rates(TICKER_API_URL)
+        logger.info("為替レートの先読みが完了しました")
+        
+    except Exception as e:
+        logger.warning("為替レートの先読みに失敗しました: %s", e)
+
+
+def close_session() -> None:
+    """HTTPセッションのコネクションプールを閉じる"""
+    _session.close()
+
+
+class ExchangeRateError(Exception):
+    """
+    為替レートを取得できなかった場合の例外
+    メッセージはそのままユーザーに表示できる文言とする
+    """
+
+
 class ExchangingTool:
     """
     為替レート取得ツール
     GMO Coin APIから為替データを取得
     """
     
-    def __init__(self):
-        self.api_url = "https://forex-api.coin.z.com/public/v1/ticker"
+    def __init__(self, session: Optional[requests.Session] = None):
+        """
+        初期化
+        
+        Args:
+            session: API呼び出しに使うHTTPセッション（省略時はモジュール共有のセッションで接続を再利用する）
+        """
+        self.api_url = TICKER_API_URL
         self.description = "為替レート情報を取得するツール"
+        self.session = session or _session
     
     def get_rates(self) -> str:
         """
@@ -27,64 +213,60 @@ class ExchangingTool:
         
         Returns:
             str: 整形された為替レート情報
+            
+        Raises:
+            ExchangeRateError: 為替データを取得できなかった場合
         """
         try:
-            response = requests.get(self.api_url, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            data, by_symbol = _fetch_rates(self.api_url, session=self.session)
             
             if data.get('status') != 0:
-                return "為替データの取得に失敗しました。"
-            
-            rates_data = data.get('data', [])
-            if not rates_data:
-                return "為替データが見つかりませんでした。"
-            
-            # 主要通貨ペアの表示
-            major_pairs = ['USD_JPY', 'EUR_JPY', 'GBP_JPY', 'AUD_JPY', 'EUR_USD']
-            
-            result = "📈 現在の為替レート\n\n"
-            
-            for rate_info in rates_data:
-                symbol = rate_info.get('symbol', '')
-                if symbol in major_pairs:
-                    bid = rate_info.get('bid', 'N/A')
-                    ask = rate_info.get('ask', 'N/A')
-                    spread = float(ask) - float(bid) if bid != 'N/A' and ask != 'N/A' else 'N/A'
-                    
-                    # 通貨ペア名を日本語表記に変換
-                    pair_names = {
-                        'USD_JPY': 'ドル/円',
-                        'EUR_JPY': 'ユーロ/円', 
-                        'GBP_JPY': 'ポンド/円',
-                        'AUD_JPY': '豪ドル/円',
-                        'EUR_USD': 'ユーロ/ドル'
-                    }
-                    
-                    pair_name = pair_names.get(symbol, symbol)
-                    
-                    result += f"🔹 {pair_name} ({symbol})\n"
-                    result += f"   買値: {bid}\n"
-                    result += f"   売値: {ask}\n"
-                    if spread != 'N/A':
-                        result += f"   スプレッド: {spread:.4f}\n"
-                    result += "\n"
+                raise ExchangeRateError("為替データの取得に失敗しました。")
+            
+            if not data.get('data', []):
+                raise ExchangeRateError("為替データが見つかりませんでした。")
+            
+            parts = ["📈 現在の為替レート\n\n"]
+            
+            # 主要通貨ペアのみをシンボル別レートから引く
+            for symbol in MAJOR_PAIRS:
+                rate_info = by_symbol.get(symbol)
+                if rate_info is None:
+                    continue
+                
+                bid = rate_info.get('bid', 'N/A')
+                ask = rate_info.get('ask', 'N/A')
+                spread = float(ask) - float(bid) if bid != 'N/A' and ask != 'N/A' else 'N/A'
+                
+                # 通貨ペア名を日本語表記に変換
+                pair_name = PAIR_NAMES.get(symbol, symbol)
+                
+                parts.append(f"🔹 {pair_name} ({symbol})\n")
+                parts.append(f"   買値: {bid}\n")
+                parts.append(f"   売値: {ask}\n")
+                if spread != 'N/A':
+                    parts.append(f"   スプレッド: {spread:.4f}\n")
+                parts.append("\n")
             
             # タイムスタンプを追加
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            result += f"⏰ 取得時刻: {current_time}\n"
-            result += "\n※ レートは参考値です。実際の取引レートとは異なる場合があります。"
+            current_time = _formatted_now()
+            parts.append(f"⏰ 取得時刻: {current_time}\n")
+            parts.append("\n※ レートは参考値です。実際の取引レートとは異なる場合があります。")
             
-            return result
+            return "".join(parts)
             
+        except ExchangeRateError:
+            raise
+        
         except requests.exceptions.RequestException as e:
-            logger.error(f"為替API呼び出しエラー: {e}")
-            return "為替データの取得中にネットワークエラーが発生しました。しばらく時間をおいてから再度お試しください。"
+            logger.error("為替API呼び出しエラー: %s", e)
+            raise ExchangeRateError(
+                "為替データの取得中にネットワークエラーが発生しました。しばらく時間をおいてから再度お試しください。"
+            ) from e
         
         except Exception as e:
-            logger.error(f"為替データ処理エラー: {e}")
-            return "為替データの処理中にエラーが発生しました。"
+            logger.error("為替データ処理エラー: %s", e)
+            raise ExchangeRateError("為替データの処理中にエラーが発生しました。") from e
     
     def get_specific_rate(self, currency_pair: str) -> str:
         """
@@ -95,42 +277,48 @@ class ExchangingTool:
             
         Returns:
             str: 通貨ペアのレート情報
+            
+        Raises:
+            ExchangeRateError: 為替データを取得できなかった場合
         """
         try:
-            response = requests.get(self.api_url, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            data, by_symbol = _fetch_rates(self.api_url, session=self.session)
             
             if data.get('status') != 0:
-                return f"{currency_pair}のデータ取得に失敗しました。"
-            
-            rates_data = data.get('data', [])
+                raise ExchangeRateError(f"{currency_pair}のデータ取得に失敗しました。")
             
             # 指定された通貨ペアを検索
-            for rate_info in rates_data:
-                if rate_info.get('symbol', '') == currency_pair.upper():
-                    bid = rate_info.get('bid', 'N/A')
-                    ask = rate_info.get('ask', 'N/A')
-                    
-                    result = f"💱 {currency_pair}\n"
-                    result += f"買値: {bid}\n"
-                    result += f"売値: {ask}\n"
-                    
-                    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    result += f"取得時刻: {current_time}"
-                    
-                    return result
-            
-            return f"通貨ペア '{currency_pair}' が見つかりませんでした。"
+            rate_info = by_symbol.get(currency_pair.upper())
+            if rate_info is None:
+                return f"通貨ペア '{currency_pair}' が見つかりませんでした。"
+            
+            bid = rate_info.get('bid', 'N/A')
+            ask = rate_info.get('ask', 'N/A')
             
+            current_time = _formatted_now()
+            
+            return (
+                f"💱 {currency_pair}\n"
+                f"買値: {bid}\n"
+                f"売値: {ask}\n"
+                f"取得時刻: {current_time}"
+            )
+            
+        except ExchangeRateError:
+            raise
+        
         except Exception as e:
-            logger.error(f"特定レート取得エラー: {e}")
-            return f"{currency_pair}のレート取得中にエラーが発生しました。"
+            logger.error("特定レート取得エラー: %s", e)
+            raise ExchangeRateError(f"{currency_pair}のレート取得中にエラーが発生しました。") from e
+
+
+# グローバルインスタンス（全てのツール呼び出しで共有）
+exchanging_tool = ExchangingTool()
 
 
 # LangChainツール形式の為替レート取得関数
-@tool
+# 戻り値はユーザー向けに整形済みのため、return_directでそのまま回答に使えることを示す
+@tool(return_direct=True)
 def get_exchange_rates() -> str:
     """
     GMO Coin APIから為替レート情報を取得します。
@@ -139,11 +327,10 @@ def get_exchange_rates() -> str:
     Returns:
         str: 整形された為替レート情報
     """
-    tool_instance = ExchangingTool()
-    return tool_instance.get_rates()
+    return exchanging_tool.get_rates()
 
 
-@tool
+@tool(return_direct=True)
 def get_specific_exchange_rate(currency_pair: str) -> str:
     """
     特定の通貨ペアの為替レートを取得します。
@@ -154,5 +341,4 @@ def get_specific_exchange_rate(currency_pair: str) -> str:
     Returns:
         str: 指定された通貨ペアのレート情報
     """
-    tool_instance = ExchangingTool()
-    return tool_instance.get_specific_rate(currency_pair)
\ No newline at end of file
+    return exchanging_tool.get_specific_rate(currency_pair)
\ No newline at end of file
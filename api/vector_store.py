@@ -1,102 +1,370 @@
 """
 ベクトルストアサービス
-URLからHTMLドキュメントを読み込み、InMemoryVectorStoreで検索機能を提供
+URLからHTMLドキュメントを読み込み、エンベディング行列による検索機能を提供
 """
 
+import hashlib
 import logging
-from typing import List, Optional
-from langchain_community.document_loaders import WebBaseLoader
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 # ログ設定
 logger = logging.getLogger(__name__)
 
+# 同一テキストのエンベディングを再利用するキャッシュの最大件数
+EMBEDDING_CACHE_SIZE = 1024
+
+# 1回のエンベディングAPI呼び出しで送るテキスト数（Gemini APIのバッチ上限）
+EMBEDDING_BATCH_SIZE = 100
+
+# URL取得・エンベディングの最大並行数
+MAX_PARALLEL_REQUESTS = 8
+
+# HTML取得のタイムアウト（秒）
+FETCH_TIMEOUT = 10
+
+# HTML取得時に送るヘッダー（WebBaseLoaderの既定ヘッダーに合わせる）
+# requestsの既定のUser-Agent（python-requests/x.y）は403やボット確認ページを返すサイトが多いため、
+# ブラウザのUser-Agentを送る（USER_AGENT環境変数で変更できる）
+FETCH_HEADERS = {
+    "User-Agent": os.getenv(
+        "USER_AGENT",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/124.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "ja,en-US;q=0.7,en;q=0.3",
+    "Referer": "https://www.google.com/",
+    "DNT": "1",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+# チャンク分割の最大文字数と、前のチャンクと重複させる文字数
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+# 分割位置として優先する区切り文字（優先度の高い順）
+SEPARATORS = ("\n\n", "\n", " ")
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    テキストを最大chunk_size文字のチャンクに分割
+    
+    各チャンクは窓内で最も優先度の高い区切り文字の直前で切る。
+    区切り位置の探索はstr.rfind（C実装）で行い、テキストを1回走査するだけで済ませる
+    
+    Args:
+        text: 分割対象のテキスト
+        chunk_size: チャンクの最大文字数
+        chunk_overlap: 前のチャンクと重複させる最大文字数
+        
+    Returns:
+        List[str]: 前後の空白を除いたチャンクのリスト
+    """
+    chunks = []
+    length = len(text)
+    start = 0
+    previous_end = 0
+    
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            # 前のチャンクと同じ位置で切り直さないよう、前回の切れ目より後ろを探す
+            lower = max(start, previous_end) + 1
+            for separator in SEPARATORS:
+                cut = text.rfind(separator, lower, end)
+                if cut >= lower:
+                    end = cut
+                    break
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        previous_end = end
+        
+        # 重複部分は単語の途中から始まらないよう、区切り文字の直後に揃える
+        # 窓内に区切り文字がなければ（日本語の文中など）文字数で重複させる
+        next_start = end
+        overlap_start = end - chunk_overlap
+        if chunk_overlap > 0 and overlap_start > start:
+            next_start = overlap_start
+            for separator in SEPARATORS:
+                boundary = text.find(separator, overlap_start, end)
+                if boundary != -1:
+                    next_start = boundary + len(separator)
+                    break
+        start = max(next_start, start + 1)
+    
+    return chunks
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """
+    ドキュメントをチャンクに分割（メタデータは各チャンクに引き継ぐ）
+    
+    Args:
+        documents: 分割対象のドキュメント
+        
+    Returns:
+        List[Document]: 分割済みドキュメント
+    """
+    return [
+        Document(page_content=chunk, metadata=dict(document.metadata))
+        for document in documents
+        for chunk in split_text(document.page_content)
+    ]
+
+
+def parse_html_document(html: bytes, url: str) -> Document:
+    """
+    HTMLから本文テキストとメタデータを抽出してドキュメントを作成
+    メタデータはWebBaseLoaderと同じ形式（source, title, description, language）
+    
+    Args:
+        html: HTMLのバイト列（文字コードはBeautifulSoupがmetaタグ等から判定）
+        url: 取得元のURL
+        
+    Returns:
+        Document: 本文テキストのドキュメント
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+class MatrixVectorStore:
+    """
+    L2正規化済みのエンベディングを連続したfloat32行列で保持するベクトルストア
+    検索は1回の行列ベクトル積（BLAS）と部分ソートで行う
+    """
+    
+    def __init__(self, documents: List[Document], vectors: List[List[float]]):
+        """
+        初期化
+        
+        Args:
+            documents: 格納するドキュメント
+            vectors: ドキュメントと同じ順序のエンベディング
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        self._matrix = np.ascontiguousarray(matrix / norms)
+        self._documents = list(documents)
+    
+    def __len__(self) -> int:
+        return len(self._documents)
+    
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 3) -> List[Document]:
+        """
+        コサイン類似度の高い順にドキュメントを取得
+        
+        Args:
+            embedding: 検索クエリのエンベディング
+            k: 取得するドキュメント数
+            
+        Returns:
+            List[Document]: 類似度の高い順のドキュメント
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        k = min(k, len(self._documents))
+        if norm == 0.0 or k <= 0:
+            return []
+        
+        similarities = self._matrix @ (query / norm)
+        
+        # 上位k件だけを部分ソートで取り出してから並べ替える
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [self._documents[i] for i in top]
+
+
 class VectorStoreService:
     """ベクトルストアサービスクラス"""
     
     def __init__(self):
         """初期化"""
-        self.vector_store: Optional[InMemoryVectorStore] = None
+        self.vector_store: Optional[MatrixVectorStore] = None
         self.embeddings: Optional[GoogleGenerativeAIEmbeddings] = None
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
-            separators=["\n\n", "\n", " ", ""]
-        )
         self.current_urls: List[str] = []
+        # 複数URLの取得でTCP/TLS接続を再利用するHTTPセッション
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_PARALLEL_REQUESTS, pool_maxsize=MAX_PARALLEL_REQUESTS)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update(FETCH_HEADERS)
+        # テキストのハッシュ → エンベディング（LRU）
+        self._embedding_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
     
     def _get_embeddings(self) -> GoogleGenerativeAIEmbeddings:
         """エンベディングインスタンスの遅延初期化"""
         if self.embeddings is None:
-            self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+            # GOOGLE_API_KEY未設定時はチャットボットと同じGEMINI_API_KEYを利用
+            self.embeddings = GoogleGenerativeAIEmbeddings(
+                model="models/embedding-001",
+                google_api_key=os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+            )
         return self.embeddings
     
+    def embed_query(self, text: str) -> Optional[List[float]]:
+        """
+        テキストのエンベディングを取得
+        
+        Args:
+            text: エンベディング対象のテキスト
+            
+        Returns:
+            Optional[List[float]]: エンベディング（取得失敗時はNone）
+        """
+        # 完全一致の再送（二重送信・リトライ等）ではエンベディングAPIを呼ばない
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._embedding_cache_lock:
+            cached = self._embedding_cache.get(key)
+            if cached is not None:
+                self._embedding_cache.move_to_end(key)
+                return cached
+        
+        try:
+            embedding = self._get_embeddings().embed_query(text)
+            
+        except Exception as e:
+            logger.error("エンベディング取得エラー: %s", e)
+            return None
+        
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = embedding
+            self._embedding_cache.move_to_end(key)
+            if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        
+        return embedding
+    
+    def _load_url(self, url: str) -> Optional[List[Document]]:
+        """
+        1つのURLからHTMLドキュメントを読み込み、チャンクに分割
+        
+        Args:
+            url: 読み込むWebページのURL
+            
+        Returns:
+            Optional[List[Document]]: 分割済みドキュメント（失敗時はNone）
+        """
+        try:
+            logger.info("HTMLドキュメントを読み込み中: %s", url)
+            
+            # 共有セッションでHTMLを取得（URLごとにセッションを作らない）
+            response = self._session.get(url, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            document = parse_html_document(response.content, url)
+            
+            # 空のコンテンツをチェック
+            if not document.page_content.strip():
+                logger.error("ドキュメントのコンテンツが空です: %s", url)
+                return None
+            
+            logger.info("ドキュメントを分割中: %s", url)
+            
+            # ドキュメントを分割
+            chunks = split_documents([document])
+            logger.info("分割完了: %s個のチャンク from %s", len(chunks), url)
+            
+            return chunks
+            
+        except Exception as e:
+            logger.error("ドキュメント読み込みエラー (%s): %s", url, e)
+            return None
+    
     def load_and_store_documents(self, urls: List[str]) -> tuple[List[str], List[str]]:
         """
         複数のURLからHTMLドキュメントを読み込み、ベクトルストアに格納
         
+        URLの取得とエンベディングはパイプライン化しており、読み込みが完了したURLのチャンクから
+        バッチにまとめて順次エンベディングを開始する（全URLの取得完了を待たない）
+        
         Args:
             urls: 読み込むWebページのURLのリスト
             
         Returns:
             tuple[List[str], List[str]]: (成功したURL, 失敗したURL)
         """
-        successful_urls = []
-        failed_urls = []
-        all_split_documents = []
+        logger.info("複数HTMLドキュメントを読み込み中: %s個のURL", len(urls))
         
-        logger.info(f"複数HTMLドキュメントを読み込み中: {len(urls)}個のURL")
+        if not urls:
+            return [], []
         
-        # 各URLからドキュメントを読み込み
-        for url in urls:
-            try:
-                logger.info(f"HTMLドキュメントを読み込み中: {url}")
-                
-                # WebBaseLoaderでHTMLを取得
-                loader = WebBaseLoader([url])  # リスト形式で渡す
-                documents = loader.load()
-                
-                if not documents:
-                    logger.error(f"ドキュメントが見つかりませんでした: {url}")
-                    failed_urls.append(url)
-                    continue
-                
-                # 空のコンテンツもチェック
-                if not documents[0].page_content.strip():
-                    logger.error(f"ドキュメントのコンテンツが空です: {url}")
-                    failed_urls.append(url)
-                    continue
+        loaded: Dict[str, Optional[List[Document]]] = {}
+        # (バッチ内のドキュメント, エンベディング結果のFuture) を投入順に保持
+        batches: List[Tuple[List[Document], Future]] = []
+        pending: List[Document] = []
+        
+        try:
+            embeddings = self._get_embeddings()
+            
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_REQUESTS, len(urls))) as load_executor, \
+                 ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as embed_executor:
                 
-                logger.info(f"ドキュメントを分割中: {len(documents)}個のドキュメント from {url}")
+                def submit_batch(documents: List[Document]) -> None:
+                    texts = [document.page_content for document in documents]
+                    batches.append((documents, embed_executor.submit(embeddings.embed_documents, texts)))
                 
-                # ドキュメントを分割
-                split_documents = self.text_splitter.split_documents(documents)
-                logger.info(f"分割完了: {len(split_documents)}個のチャンク from {url}")
+                futures = {load_executor.submit(self._load_url, url): url for url in urls}
+                for future in as_completed(futures):
+                    chunks = future.result()
+                    loaded[futures[future]] = chunks
+                    if not chunks:
+                        continue
+                    
+                    # バッチサイズに達した分から取得中の他のURLと並行してエンベディング
+                    pending.extend(chunks)
+                    while len(pending) >= EMBEDDING_BATCH_SIZE:
+                        submit_batch(pending[:EMBEDDING_BATCH_SIZE])
+                        pending = pending[EMBEDDING_BATCH_SIZE:]
                 
-                all_split_documents.extend(split_documents)
-                successful_urls.append(url)
+                if pending:
+                    submit_batch(pending)
                 
-            except Exception as e:
-                logger.error(f"ドキュメント読み込みエラー ({url}): {e}")
-                failed_urls.append(url)
+                all_split_documents: List[Document] = []
+                vectors: List[List[float]] = []
+                for documents, embedding_future in batches:
+                    vectors.extend(embedding_future.result())
+                    all_split_documents.extend(documents)
+                    
+        except Exception as e:
+            logger.error("ベクトルストア構築エラー: %s", e)
+            return [], urls  # 全て失敗として扱う
+        
+        # 成功・失敗したURLは入力順で返す
+        successful_urls = [url for url in urls if loaded.get(url)]
+        failed_urls = [url for url in urls if not loaded.get(url)]
         
         # 成功したドキュメントがある場合のみベクトルストアを構築
         if all_split_documents:
-            try:
-                embeddings = self._get_embeddings()
-                self.vector_store = InMemoryVectorStore.from_documents(
-                    documents=all_split_documents,
-                    embedding=embeddings
-                )
-                
-                self.current_urls = successful_urls
-                logger.info(f"ベクトルストア構築完了: {len(successful_urls)}個のURL")
-            except Exception as e:
-                logger.error(f"ベクトルストア構築エラー: {e}")
-                return [], urls  # 全て失敗として扱う
+            self.vector_store = MatrixVectorStore(all_split_documents, vectors)
+            self.current_urls = successful_urls
+            logger.info("ベクトルストア構築完了: %s個のURL", len(successful_urls))
         
         return successful_urls, failed_urls
     
@@ -116,13 +384,40 @@ class VectorStoreService:
             return []
         
         try:
-            logger.info(f"ドキュメント検索中: {query}")
-            results = self.vector_store.similarity_search(query, k=k)
-            logger.info(f"検索結果: {len(results)}個のドキュメント")
+            logger.info("ドキュメント検索中: %s", query)
+            embedding = self.embed_query(query)
+            if embedding is None:
+                return []
+            results = self.vector_store.similarity_search_by_vector(embedding, k=k)
+            logger.info("検索結果: %s個のドキュメント", len(results))
             return results
             
         except Exception as e:
-            logger.error(f"ドキュメント検索エラー: {e}")
+            logger.error("ドキュメント検索エラー: %s", e)
+            return []
+    
+    def search_documents_by_vector(self, embedding: List[float], k: int = 3) -> List[Document]:
+        """
+        エンベディングを指定してベクトルストアから関連ドキュメントを検索
+        
+        Args:
+            embedding: 検索クエリのエンベディング
+            k: 取得する関連ドキュメント数
+            
+        Returns:
+            List[Document]: 関連ドキュメントのリスト
+        """
+        if not self.vector_store:
+            logger.warning("ベクトルストアが初期化されていません")
+            return []
+        
+        try:
+            results = self.vector_store.similarity_search_by_vector(embedding, k=k)
+            logger.info("検索結果: %s個のドキュメント", len(results))
+            return results
+            
+        except Exception as e:
+            logger.error("ドキュメント検索エラー: %s", e)
             return []
     
     def clear_vector_store(self) -> bool:
@@ -139,7 +434,7 @@ class VectorStoreService:
             return True
             
         except Exception as e:
-            logger.error(f"ベクトルストアクリアエラー: {e}")
+            logger.error("ベクトルストアクリアエラー: %s", e)
             return False
     
     def is_initialized(self) -> bool:
@@ -159,6 +454,10 @@ class VectorStoreService:
             List[str]: 現在のURLリスト
         """
         return self.current_urls
+    
+    def close(self) -> None:
+        """HTTPセッションのコネクションプールを閉じる"""
+        self._session.close()
 
 # グローバルインスタンス
 vector_store_service = VectorStoreService()
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+テスト共通のフィクスチャ
+"""
+
+import os
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from api.main import app
+
+
+def pytest_xdist_auto_num_workers(config):
+    """-n autoのワーカー数をCPU数-2にする（実行環境用に2コア残す）"""
+    # PYTEST_XDIST_AUTO_NUM_WORKERSが設定されていればそちらを優先する
+    workers = os.getenv("PYTEST_XDIST_AUTO_NUM_WORKERS")
+    if workers:
+        return int(workers)
+    return max(1, (os.cpu_count() or 1) - 2)
+
+
+@pytest.fixture(scope="module")
+def client():
+    """モジュール内で共有するテストクライアント（ライフスパンは1回だけ実行）"""
+    # 起動時の為替レート先読みで外部APIへアクセスしないようにする
+    # サーバー側の例外はテスト内で再送出せず、500レスポンスとして検証する
+    with patch('api.main.prefetch_rates'):
+        with TestClient(app, raise_server_exceptions=False) as test_client:
+            yield test_client
+
+
+@pytest.fixture(scope="session")
+def openapi_schema():
+    """セッション内で共有するOpenAPIスキーマ（FastAPIがapp.openapi_schemaにキャッシュする）"""
+    return app.openapi()
@@ -3,11 +3,53 @@
 LangChain Function Callingとツール実行のテスト
 """
 
+import asyncio
 import pytest
 import os
-from unittest.mock import Mock, MagicMock, patch, call
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from api.bot import FunctionCallingChatBot
+from unittest.mock import Mock, MagicMock, AsyncMock, patch, call
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, SystemMessage, ToolMessage
+from api.bot import FunctionCallingChatBot, OUT_OF_SCOPE_RESPONSE, SYSTEM_MESSAGE_WITH_CONTEXT, SYSTEM_PROMPT_WITH_CONTEXT, TOOL_ERROR_MESSAGE, currency_tag
+from api.tools import ExchangeRateError
+
+
+@pytest.fixture(autouse=True)
+def no_embeddings():
+    """エンベディングAPIを呼び出さないようにする（セマンティックキャッシュ無効）"""
+    with patch('api.bot.vector_store_service.embed_query', return_value=None) as mock_embed:
+        yield mock_embed
+
+
+@pytest.fixture(autouse=True)
+def no_rates_prefetch():
+    """為替APIへの先読みリクエストを送信しないようにする"""
+    with patch('api.bot.prefetch_rates') as mock_prefetch:
+        yield mock_prefetch
+
+
+@pytest.fixture(scope="class")
+def shared_bot():
+    """APIキーとLLMをモックしたチャットボット（テストクラス内で共有）"""
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}), \
+         patch('api.bot.ChatGoogleGenerativeAI'):
+        yield FunctionCallingChatBot()
+
+
+@pytest.fixture
+def bot(shared_bot, monkeypatch):
+    """共有チャットボット（テスト中に差し替えた属性はテスト終了時に元に戻す）"""
+    for name in ("llm", "llm_with_tools", "direct_tool_answers"):
+        monkeypatch.setattr(shared_bot, name, getattr(shared_bot, name))
+    shared_bot.response_cache.clear()
+    return shared_bot
+
+
+class BotTestBase:
+    """共有チャットボットをself.botとして使うテストクラスの基底クラス"""
+
+    @pytest.fixture(autouse=True)
+    def setup_bot(self, bot):
+        """テストメソッドの初期化"""
+        self.bot = bot
 
 
 class TestFunctionCallingChatBotInit:
@@ -60,130 +102,146 @@ class TestFunctionCallingChatBotInit:
         assert bot.llm_with_tools is None
 
 
-class TestFunctionCallingChatBotExecuteTool:
+class TestFunctionCallingChatBotExecuteTool(BotTestBase):
     """ツール実行メソッドのテスト"""
 
-    def setup_method(self):
-        """テストメソッドの初期化"""
-        with patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}):
-            with patch('api.bot.ChatGoogleGenerativeAI'):
-                self.bot = FunctionCallingChatBot()
-
-    @patch('api.bot.get_exchange_rates')
-    def test_execute_get_exchange_rates(self, mock_get_rates):
+    @pytest.mark.asyncio
+    async def test_execute_get_exchange_rates(self):
         """get_exchange_ratesツールの実行テスト"""
-        mock_get_rates.invoke.return_value = "モック為替レート情報"
+        mock_get_rates = MagicMock()
+        mock_get_rates.ainvoke = AsyncMock(return_value="モック為替レート情報")
         
         tool_call = {
             'name': 'get_exchange_rates',
             'args': {}
         }
         
-        result = self.bot._execute_tool(tool_call)
+        with patch.dict(self.bot.TOOLS, {'get_exchange_rates': mock_get_rates}):
+            result = await self.bot._execute_tool(tool_call)
         
-        mock_get_rates.invoke.assert_called_once_with({})
-        assert result == "モック為替レート情報"
+        mock_get_rates.ainvoke.assert_called_once_with({})
+        assert result == ("モック為替レート情報", True)
 
-    @patch('api.bot.get_specific_exchange_rate')
-    def test_execute_get_specific_exchange_rate(self, mock_get_specific_rate):
+    @pytest.mark.asyncio
+    async def test_execute_get_specific_exchange_rate(self):
         """get_specific_exchange_rateツールの実行テスト"""
-        mock_get_specific_rate.invoke.return_value = "モック特定為替レート情報"
+        mock_get_specific_rate = MagicMock()
+        mock_get_specific_rate.ainvoke = AsyncMock(return_value="モック特定為替レート情報")
         
         tool_call = {
             'name': 'get_specific_exchange_rate',
             'args': {'currency_pair': 'USD_JPY'}
         }
         
-        result = self.bot._execute_tool(tool_call)
+        with patch.dict(self.bot.TOOLS, {'get_specific_exchange_rate': mock_get_specific_rate}):
+            result = await self.bot._execute_tool(tool_call)
         
-        mock_get_specific_rate.invoke.assert_called_once_with({'currency_pair': 'USD_JPY'})
-        assert result == "モック特定為替レート情報"
+        mock_get_specific_rate.ainvoke.assert_called_once_with({'currency_pair': 'USD_JPY'})
+        assert result == ("モック特定為替レート情報", True)
 
-    def test_execute_unknown_tool(self):
+    @pytest.mark.asyncio
+    async def test_execute_unknown_tool(self):
         """未知のツールの実行テスト"""
         tool_call = {
             'name': 'unknown_tool',
             'args': {}
         }
         
-        result = self.bot._execute_tool(tool_call)
-        assert result == "不明なツール: unknown_tool"
+        result = await self.bot._execute_tool(tool_call)
+        assert result == ("不明なツール: unknown_tool", False)
 
-    @patch('api.bot.get_exchange_rates')
-    def test_execute_tool_exception(self, mock_get_rates):
+    @pytest.mark.asyncio
+    async def test_execute_tool_exception(self):
         """ツール実行中の例外テスト"""
-        mock_get_rates.invoke.side_effect = Exception("Tool execution error")
+        mock_get_rates = MagicMock()
+        mock_get_rates.ainvoke = AsyncMock(side_effect=Exception("Tool execution error"))
         
         tool_call = {
             'name': 'get_exchange_rates',
             'args': {}
         }
         
-        result = self.bot._execute_tool(tool_call)
-        assert "ツール実行中にエラーが発生しました" in result
+        with patch.dict(self.bot.TOOLS, {'get_exchange_rates': mock_get_rates}):
+            result = await self.bot._execute_tool(tool_call)
+        
+        # 例外の内容はユーザー向けの文言に含めない
+        assert result == (TOOL_ERROR_MESSAGE, False)
+
+    @pytest.mark.asyncio
+    async def test_execute_tool_exchange_rate_error(self):
+        """為替レート取得失敗時はユーザー向けの文言が失敗として返ることのテスト"""
+        mock_get_rates = MagicMock()
+        mock_get_rates.ainvoke = AsyncMock(side_effect=ExchangeRateError("為替データの取得に失敗しました。"))
+        
+        with patch.dict(self.bot.TOOLS, {'get_exchange_rates': mock_get_rates}):
+            result = await self.bot._execute_tool({'name': 'get_exchange_rates', 'args': {}})
+        
+        assert result == ("為替データの取得に失敗しました。", False)
 
-    def test_execute_tool_missing_name(self):
+    @pytest.mark.asyncio
+    async def test_execute_tool_missing_name(self):
         """ツール名が欠けている場合のテスト"""
         tool_call = {
             'args': {}
         }
         
-        result = self.bot._execute_tool(tool_call)
-        assert result == "不明なツール: "
+        result = await self.bot._execute_tool(tool_call)
+        assert result == ("不明なツール: ", False)
 
-    def test_execute_tool_missing_args(self):
+    @pytest.mark.asyncio
+    async def test_execute_tool_missing_args(self):
         """引数が欠けている場合のテスト"""
         tool_call = {
             'name': 'get_specific_exchange_rate'
         }
         
-        with patch('api.bot.get_specific_exchange_rate') as mock_tool:
-            mock_tool.invoke.return_value = "結果"
-            result = self.bot._execute_tool(tool_call)
-            mock_tool.invoke.assert_called_once_with({})
+        mock_tool = MagicMock()
+        mock_tool.ainvoke = AsyncMock(return_value="結果")
+        with patch.dict(self.bot.TOOLS, {'get_specific_exchange_rate': mock_tool}):
+            result = await self.bot._execute_tool(tool_call)
+            mock_tool.ainvoke.assert_called_once_with({})
 
 
-class TestFunctionCallingChatBotProcessMessage:
+class TestFunctionCallingChatBotProcessMessage(BotTestBase):
     """メッセージ処理メソッドのテスト"""
 
-    def setup_method(self):
-        """テストメソッドの初期化"""
-        with patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}):
-            with patch('api.bot.ChatGoogleGenerativeAI'):
-                self.bot = FunctionCallingChatBot()
-
-    def test_process_message_no_llm(self):
+    @pytest.mark.asyncio
+    async def test_process_message_no_llm(self):
         """LLMが初期化されていない場合のテスト"""
         self.bot.llm_with_tools = None
         
-        result = self.bot.process_message("テストメッセージ")
+        result, cacheable = await self.bot.process_message("テストメッセージ")
         
         assert "システムの初期化中にエラーが発生しました" in result
         assert "GEMINI_API_KEY" in result
+        assert cacheable is False
 
-    def test_process_message_without_tool_calls(self):
+    @pytest.mark.asyncio
+    async def test_process_message_without_tool_calls(self):
         """ツール呼び出しがない場合のメッセージ処理テスト"""
         # モックLLMの設定
         mock_llm_with_tools = MagicMock()
         mock_response = MagicMock()
         mock_response.tool_calls = []  # ツール呼び出しなし
         mock_response.content = "通常のレスポンス"
-        mock_llm_with_tools.invoke.return_value = mock_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
         
         self.bot.llm_with_tools = mock_llm_with_tools
         
-        result = self.bot.process_message("こんにちは")
+        result, _ = await self.bot.process_message("円相場について教えて")
         
         # LLMが呼び出されたことを確認
-        mock_llm_with_tools.invoke.assert_called_once()
-        call_args = mock_llm_with_tools.invoke.call_args[0][0]
-        assert len(call_args) == 1
-        assert isinstance(call_args[0], HumanMessage)
-        assert "こんにちは" in call_args[0].content
+        mock_llm_with_tools.ainvoke.assert_called_once()
+        call_args = mock_llm_with_tools.ainvoke.call_args[0][0]
+        assert len(call_args) == 2
+        assert isinstance(call_args[0], SystemMessage)
+        assert isinstance(call_args[1], HumanMessage)
+        assert call_args[1].content == "円相場について教えて"
         
         assert result == "通常のレスポンス"
 
-    def test_process_message_with_tool_calls(self):
+    @pytest.mark.asyncio
+    async def test_process_message_with_tool_calls(self):
         """ツール呼び出しがある場合のメッセージ処理テスト"""
         # モックLLMの設定
         mock_llm = MagicMock()
@@ -203,37 +261,39 @@ class TestFunctionCallingChatBotProcessMessage:
         mock_final_response = MagicMock()
         mock_final_response.content = "為替レート情報を取得しました"
         
-        mock_llm_with_tools.invoke.return_value = mock_first_response
-        mock_llm.invoke.return_value = mock_final_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_first_response)
+        mock_llm.ainvoke = AsyncMock(return_value=mock_final_response)
         
         self.bot.llm = mock_llm
         self.bot.llm_with_tools = mock_llm_with_tools
         
         # _execute_toolメソッドをモック化
         with patch.object(self.bot, '_execute_tool') as mock_execute_tool:
-            mock_execute_tool.return_value = "モック為替レート結果"
+            mock_execute_tool.return_value = ("モック為替レート結果", True)
             
-            result = self.bot.process_message("為替レートを教えて")
+            result, _ = await self.bot.process_message("ドル円とユーロ円の為替レートを比較して")
             
             # 最初のLLM呼び出しが行われたことを確認
-            mock_llm_with_tools.invoke.assert_called_once()
+            mock_llm_with_tools.ainvoke.assert_called_once()
             
             # ツール実行が呼び出されたことを確認
             mock_execute_tool.assert_called_once_with(mock_tool_call)
             
             # 最終的なLLM呼び出しが行われたことを確認
-            mock_llm.invoke.assert_called_once()
-            final_call_args = mock_llm.invoke.call_args[0][0]
+            mock_llm.ainvoke.assert_called_once()
+            final_call_args = mock_llm.ainvoke.call_args[0][0]
             
             # メッセージ履歴の確認
-            assert len(final_call_args) == 3  # HumanMessage, AIMessage, ToolMessage
-            assert isinstance(final_call_args[0], HumanMessage)
-            assert final_call_args[1] == mock_first_response
-            assert isinstance(final_call_args[2], ToolMessage)
+            assert len(final_call_args) == 4  # SystemMessage, HumanMessage, AIMessage, ToolMessage
+            assert isinstance(final_call_args[0], SystemMessage)
+            assert isinstance(final_call_args[1], HumanMessage)
+            assert final_call_args[2] == mock_first_response
+            assert isinstance(final_call_args[3], ToolMessage)
             
             assert result == "為替レート情報を取得しました"
 
-    def test_process_message_multiple_tool_calls(self):
+    @pytest.mark.asyncio
+    async def test_process_message_multiple_tool_calls(self):
         """複数のツール呼び出しがある場合のテスト"""
         mock_llm = MagicMock()
         mock_llm_with_tools = MagicMock()
@@ -259,16 +319,16 @@ class TestFunctionCallingChatBotProcessMessage:
         mock_final_response = MagicMock()
         mock_final_response.content = "複数の為替情報を取得しました"
         
-        mock_llm_with_tools.invoke.return_value = mock_first_response
-        mock_llm.invoke.return_value = mock_final_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_first_response)
+        mock_llm.ainvoke = AsyncMock(return_value=mock_final_response)
         
         self.bot.llm = mock_llm
         self.bot.llm_with_tools = mock_llm_with_tools
         
         with patch.object(self.bot, '_execute_tool') as mock_execute_tool:
-            mock_execute_tool.side_effect = ["結果1", "結果2"]
+            mock_execute_tool.side_effect = [("結果1", True), ("結果2", True)]
             
-            result = self.bot.process_message("為替レートを教えて")
+            result, _ = await self.bot.process_message("ドル円とユーロ円の為替レートを比較して")
             
             # 2回のツール実行が行われたことを確認
             assert mock_execute_tool.call_count == 2
@@ -278,37 +338,40 @@ class TestFunctionCallingChatBotProcessMessage:
             ])
             
             # 最終的なLLM呼び出しの確認
-            final_call_args = mock_llm.invoke.call_args[0][0]
-            assert len(final_call_args) == 4  # HumanMessage, AIMessage, ToolMessage, ToolMessage
+            final_call_args = mock_llm.ainvoke.call_args[0][0]
+            assert len(final_call_args) == 5  # SystemMessage, HumanMessage, AIMessage, ToolMessage, ToolMessage
             
             assert result == "複数の為替情報を取得しました"
 
-    def test_process_message_exception(self):
+    @pytest.mark.asyncio
+    async def test_process_message_exception(self):
         """メッセージ処理中の例外テスト"""
         mock_llm_with_tools = MagicMock()
-        mock_llm_with_tools.invoke.side_effect = Exception("LLM error")
+        mock_llm_with_tools.ainvoke = AsyncMock(side_effect=Exception("LLM error"))
         
         self.bot.llm_with_tools = mock_llm_with_tools
         
-        result = self.bot.process_message("テストメッセージ")
+        result, cacheable = await self.bot.process_message("ドル円のレートは？")
         
         assert "処理中にエラーが発生しました" in result
         assert "しばらく時間をおいてから再度お試しください" in result
+        assert cacheable is False
 
-    def test_system_prompt_content(self):
+    @pytest.mark.asyncio
+    async def test_system_prompt_content(self):
         """システムプロンプトの内容確認テスト"""
         mock_llm_with_tools = MagicMock()
         mock_response = MagicMock()
         mock_response.tool_calls = []
         mock_response.content = "レスポンス"
-        mock_llm_with_tools.invoke.return_value = mock_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
         
         self.bot.llm_with_tools = mock_llm_with_tools
         
-        self.bot.process_message("テストメッセージ")
+        await self.bot.process_message("ドル円のレートは？")
         
         # LLMに渡されたメッセージの内容を確認
-        call_args = mock_llm_with_tools.invoke.call_args[0][0]
+        call_args = mock_llm_with_tools.ainvoke.call_args[0][0]
         message_content = call_args[0].content
         
         # システムプロンプトの主要要素が含まれていることを確認
@@ -317,9 +380,12 @@ class TestFunctionCallingChatBotProcessMessage:
         assert "get_exchange_rates" in message_content
         assert "get_specific_exchange_rate" in message_content
         assert "常に日本語で回答" in message_content
-        assert "テストメッセージ" in message_content
+        # ユーザーメッセージはシステムプロンプトと分離されていることを確認
+        assert "ドル円のレートは？" not in message_content
+        assert call_args[-1].content == "ドル円のレートは？"
 
-    def test_tool_message_creation(self):
+    @pytest.mark.asyncio
+    async def test_tool_message_creation(self):
         """ToolMessageの作成テスト"""
         mock_llm = MagicMock()
         mock_llm_with_tools = MagicMock()
@@ -337,33 +403,34 @@ class TestFunctionCallingChatBotProcessMessage:
         mock_final_response = MagicMock()
         mock_final_response.content = "最終レスポンス"
         
-        mock_llm_with_tools.invoke.return_value = mock_first_response
-        mock_llm.invoke.return_value = mock_final_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_first_response)
+        mock_llm.ainvoke = AsyncMock(return_value=mock_final_response)
         
         self.bot.llm = mock_llm
         self.bot.llm_with_tools = mock_llm_with_tools
         
         with patch.object(self.bot, '_execute_tool') as mock_execute_tool:
-            mock_execute_tool.return_value = "ツール結果"
+            mock_execute_tool.return_value = ("ツール結果", True)
             
-            self.bot.process_message("テスト")
+            await self.bot.process_message("ドル円の見通しは？")
             
             # 最終的なLLM呼び出しでToolMessageが正しく作成されたことを確認
-            final_call_args = mock_llm.invoke.call_args[0][0]
-            tool_message = final_call_args[2]
+            final_call_args = mock_llm.ainvoke.call_args[0][0]
+            tool_message = final_call_args[-1]
             
             assert isinstance(tool_message, ToolMessage)
             assert tool_message.content == "ツール結果"
             assert tool_message.tool_call_id == "test_tool_id"
 
 
+@pytest.mark.integration
 class TestFunctionCallingChatBotIntegration:
     """統合テスト"""
 
     @patch.dict(os.environ, {'GEMINI_API_KEY': 'test-api-key'})
     @patch('api.bot.ChatGoogleGenerativeAI')
-    @patch('api.bot.get_exchange_rates')
-    def test_full_exchange_rate_workflow(self, mock_get_rates, mock_chat_google):
+    @pytest.mark.asyncio
+    async def test_full_exchange_rate_workflow(self, mock_chat_google):
         """為替レート取得の完全なワークフローテスト"""
         # LLMの設定
         mock_llm = MagicMock()
@@ -385,27 +452,602 @@ class TestFunctionCallingChatBotIntegration:
         mock_final_response = MagicMock()
         mock_final_response.content = "現在の為替レートは以下の通りです：..."
         
-        mock_llm_with_tools.invoke.return_value = mock_first_response
-        mock_llm.invoke.return_value = mock_final_response
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_first_response)
+        mock_llm.ainvoke = AsyncMock(return_value=mock_final_response)
         
         # ツールのモック設定
-        mock_get_rates.invoke.return_value = "USD/JPY: 150.00"
+        mock_get_rates = MagicMock()
+        mock_get_rates.ainvoke = AsyncMock(return_value="USD/JPY: 150.00")
         
         bot = FunctionCallingChatBot()
-        result = bot.process_message("今日の為替レートを教えて")
+        with patch.dict(bot.TOOLS, {'get_exchange_rates': mock_get_rates}):
+            result, _ = await bot.process_message("今日の為替レートを解説して")
         
         # 全体のワークフローが正しく実行されたことを確認
-        mock_llm_with_tools.invoke.assert_called_once()
-        mock_get_rates.invoke.assert_called_once_with({})
-        mock_llm.invoke.assert_called_once()
+        mock_llm_with_tools.ainvoke.assert_called_once()
+        mock_get_rates.ainvoke.assert_called_once_with({})
+        mock_llm.ainvoke.assert_called_once()
         
         assert result == "現在の為替レートは以下の通りです：..."
 
+    @pytest.mark.asyncio
     @patch.dict(os.environ, {}, clear=True)
-    def test_no_api_key_workflow(self):
+    async def test_no_api_key_workflow(self):
         """APIキーなしでのワークフローテスト"""
         bot = FunctionCallingChatBot()
-        result = bot.process_message("テストメッセージ")
+        result, _ = await bot.process_message("テストメッセージ")
         
         assert "GEMINI_API_KEY" in result
-        assert "システムの初期化中にエラーが発生しました" in result
\ No newline at end of file
+        assert "システムの初期化中にエラーが発生しました" in result
+
+
+class TestFunctionCallingChatBotSemanticCache(BotTestBase):
+    """セマンティックキャッシュ連携のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_cache_miss_stores_response(self, no_embeddings):
+        """キャッシュミス時にLLMの回答が登録されることのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm_with_tools = MagicMock()
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "初回の回答"
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        result, cacheable = await self.bot.process_message("ドル円のレートは？")
+        
+        assert result == "初回の回答"
+        assert cacheable is True
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0], currency_tag("ドル円のレートは？")) == "初回の回答"
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_llm(self, no_embeddings):
+        """キャッシュヒット時にLLMが呼び出されないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        self.bot.response_cache.store([0.99, 0.01, 0.0], "キャッシュ済みの回答", currency_tag("ドル円のレートを教えて"))
+        mock_llm_with_tools = MagicMock()
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        result, _ = await self.bot.process_message("ドル円のレートを教えて")
+        
+        assert result == "キャッシュ済みの回答"
+        mock_llm_with_tools.ainvoke.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_error_response_not_cached(self, no_embeddings):
+        """エラー時の回答がキャッシュされないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm_with_tools = MagicMock()
+        mock_llm_with_tools.ainvoke = AsyncMock(side_effect=Exception("LLM error"))
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        await self.bot.process_message("ドル円のレートは？")
+        
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0], currency_tag("ドル円のレートは？")) is None
+
+    @pytest.mark.asyncio
+    async def test_tool_answer_not_cached(self, no_embeddings):
+        """ツール結果（為替レート）を含む回答はキャッシュされないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        self.bot.llm_with_tools = MagicMock()
+        self.bot.llm_with_tools.ainvoke = AsyncMock(return_value=AIMessage(content="", tool_calls=[
+            {'name': 'get_specific_exchange_rate', 'args': {'currency_pair': 'USD_JPY'}, 'id': 'call_1'}
+        ]))
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("💱 USD_JPY", True)):
+            result, _ = await self.bot.process_message("ドル円のレートは？")
+        
+        assert result == "💱 USD_JPY"
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0], currency_tag("ドル円のレートは？")) is None
+
+    @pytest.mark.asyncio
+    async def test_other_currency_pair_not_served_from_cache(self, no_embeddings):
+        """エンベディングが類似していても通貨が異なる質問にはキャッシュを返さないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        self.bot.response_cache.store([1.0, 0.0, 0.0], "ドル円の回答", currency_tag("ドル円とは？"))
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "ユーロ円の回答"
+        self.bot.llm_with_tools = MagicMock()
+        self.bot.llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+        
+        result, _ = await self.bot.process_message("ユーロ円とは？")
+        
+        assert result == "ユーロ円の回答"
+
+    @pytest.mark.parametrize("message, expected", [
+        ("ドル円のレートは？", "ドル|円"),
+        ("円ドルのレートは？", "ドル|円"),
+        ("usd_jpyを教えて", "JPY|USD"),
+        ("こんにちは", ""),
+    ])
+    def test_currency_tag(self, message, expected):
+        """メッセージ中の通貨表記からタグが生成されることのテスト"""
+        assert currency_tag(message) == expected
+
+
+class TestFunctionCallingChatBotContextSearch(BotTestBase):
+    """コンテキストドキュメント検索のテスト"""
+
+    @patch('api.bot.vector_store_service')
+    def test_search_uses_message_embedding(self, mock_service):
+        """メッセージのエンベディングでそのまま検索することのテスト"""
+        mock_service.is_initialized.return_value = True
+        mock_service.search_documents_by_vector.return_value = ["doc"]
+        
+        result = self.bot._search_context_documents([0.1, 0.2, 0.3])
+        
+        assert result == ["doc"]
+        mock_service.search_documents_by_vector.assert_called_once_with([0.1, 0.2, 0.3], k=3)
+
+    @patch('api.bot.vector_store_service')
+    def test_search_skipped_without_embedding(self, mock_service):
+        """エンベディング取得失敗時に検索しないことのテスト"""
+        mock_service.is_initialized.return_value = True
+        
+        result = self.bot._search_context_documents(None)
+        
+        assert result == []
+        mock_service.search_documents_by_vector.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_no_query_rewrite_llm_call(self, no_embeddings):
+        """検索クエリ生成のためのLLM呼び出しが行われないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm = MagicMock()
+        mock_llm_with_tools = MagicMock()
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "回答"
+        mock_llm.ainvoke = AsyncMock()
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+        self.bot.llm = mock_llm
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        with patch('api.bot.vector_store_service.is_initialized', return_value=True), \
+             patch('api.bot.vector_store_service.search_documents_by_vector', return_value=[]) as mock_search:
+            result, _ = await self.bot.process_message("ドル円のレートは？")
+        
+        assert result == "回答"
+        mock_search.assert_called_once_with([1.0, 0.0, 0.0], k=3)
+        mock_llm.ainvoke.assert_not_called()
+        mock_llm_with_tools.ainvoke.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_context_placed_after_static_prompt(self, no_embeddings):
+        """検索コンテキストが固定のシステムプロンプトの後に置かれることのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm_with_tools = MagicMock()
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "回答"
+        mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+        self.bot.llm_with_tools = mock_llm_with_tools
+        document = MagicMock()
+        document.page_content = "ページの内容"
+        
+        with patch('api.bot.vector_store_service.is_initialized', return_value=True), \
+             patch('api.bot.vector_store_service.search_documents_by_vector', return_value=[document]):
+            await self.bot.process_message("質問")
+        
+        call_args = mock_llm_with_tools.ainvoke.call_args[0][0]
+        assert len(call_args) == 3
+        assert call_args[0] is SYSTEM_MESSAGE_WITH_CONTEXT
+        assert call_args[0].content == SYSTEM_PROMPT_WITH_CONTEXT
+        assert isinstance(call_args[1], SystemMessage)
+        assert "ページの内容" in call_args[1].content
+        assert isinstance(call_args[2], HumanMessage)
+        assert call_args[2].content == "質問"
+
+
+class TestFunctionCallingChatBotStreaming(BotTestBase):
+    """ストリーミング処理のテスト"""
+
+    @staticmethod
+    def _astream(*chunks):
+        """指定したチャンクを順に返すastreamの代替"""
+        async def fake_astream(messages):
+            for chunk in chunks:
+                yield chunk
+        return fake_astream
+
+    async def _collect(self, message):
+        """stream_messageの出力をリストにまとめる"""
+        return [delta async for delta in self.bot.stream_message(message)]
+
+    @pytest.mark.asyncio
+    async def test_stream_without_tool_calls(self, no_embeddings):
+        """ツール呼び出しがない場合に断片がそのまま送出されることのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm_with_tools = MagicMock()
+        mock_llm_with_tools.astream = self._astream(
+            AIMessageChunk(content="こんにちは"),
+            AIMessageChunk(content="！")
+        )
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        deltas = await self._collect("円相場について教えて")
+        
+        assert deltas == ["こんにちは", "！"]
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0], currency_tag("円相場について教えて")) == "こんにちは！"
+
+    @pytest.mark.asyncio
+    async def test_stream_with_tool_calls(self):
+        """ツール呼び出し後の最終回答がストリーミングされることのテスト"""
+        mock_llm = MagicMock()
+        mock_llm_with_tools = MagicMock()
+        mock_llm_with_tools.astream = self._astream(
+            AIMessageChunk(content="", tool_call_chunks=[
+                {'name': 'get_exchange_rates', 'args': '{}', 'id': 'call_1', 'index': 0}
+            ])
+        )
+        mock_llm.astream = self._astream(
+            AIMessageChunk(content="ドル円は"),
+            AIMessageChunk(content="150円です")
+        )
+        self.bot.llm = mock_llm
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("USD/JPY: 150.00", True)) as mock_execute_tool:
+            deltas = await self._collect("ドル円の見通しは？")
+        
+        assert deltas == ["ドル円は", "150円です"]
+        mock_execute_tool.assert_called_once()
+        assert mock_execute_tool.call_args[0][0]['name'] == 'get_exchange_rates'
+
+    @pytest.mark.asyncio
+    async def test_stream_cache_hit(self, no_embeddings):
+        """キャッシュヒット時に回答がまとめて返されることのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        self.bot.response_cache.store([1.0, 0.0, 0.0], "キャッシュ済みの回答", currency_tag("ドル円は？"))
+        
+        deltas = await self._collect("ドル円は？")
+        
+        assert deltas == ["キャッシュ済みの回答"]
+
+    @pytest.mark.asyncio
+    async def test_stream_no_llm(self):
+        """LLMが初期化されていない場合のテスト"""
+        self.bot.llm_with_tools = None
+        
+        deltas = await self._collect("テスト")
+        
+        assert len(deltas) == 1
+        assert "GEMINI_API_KEY" in deltas[0]
+
+
+    @pytest.mark.asyncio
+    async def test_stream_failed_tool_not_cached(self, no_embeddings):
+        """ツールが失敗した場合はエラー文言をそのまま返さず、回答もキャッシュしないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        mock_llm = MagicMock()
+        mock_llm_with_tools = MagicMock()
+        mock_llm_with_tools.astream = self._astream(
+            AIMessageChunk(content="", tool_call_chunks=[
+                {'name': 'get_exchange_rates', 'args': '{}', 'id': 'call_1', 'index': 0}
+            ])
+        )
+        mock_llm.astream = self._astream(AIMessageChunk(content="現在レートを取得できません"))
+        self.bot.llm = mock_llm
+        self.bot.llm_with_tools = mock_llm_with_tools
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("為替データの取得に失敗しました。", False)):
+            deltas = await self._collect("為替レートを教えて")
+        
+        assert deltas == ["現在レートを取得できません"]
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0]) is None
+
+class TestFunctionCallingChatBotDirectToolAnswer(BotTestBase):
+    """整形済みツール結果の直接回答のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup_mocks(self, setup_bot):
+        """LLMなどのモックを設定"""
+        self.mock_llm = MagicMock()
+        self.mock_llm.ainvoke = AsyncMock()
+        self.mock_llm_with_tools = MagicMock()
+        first_response = AIMessage(content="", tool_calls=[
+            {'name': 'get_exchange_rates', 'args': {}, 'id': 'call_1'}
+        ])
+        self.mock_llm_with_tools.ainvoke = AsyncMock(return_value=first_response)
+        self.bot.llm = self.mock_llm
+        self.bot.llm_with_tools = self.mock_llm_with_tools
+
+    @pytest.mark.asyncio
+    async def test_tool_result_returned_directly(self):
+        """return_directなツールの結果がそのまま回答になることのテスト"""
+        with patch.object(self.bot, '_execute_tool', return_value=("📈 現在の為替レート", True)):
+            result, _ = await self.bot.process_message("為替レートを教えて")
+        
+        assert result == "📈 現在の為替レート"
+        self.mock_llm.ainvoke.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_synthesis_request_uses_llm(self):
+        """解釈を求めるメッセージではLLMで回答を生成することのテスト"""
+        final_response = MagicMock()
+        final_response.content = "ドル円は上昇傾向です"
+        self.mock_llm.ainvoke.return_value = final_response
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("📈 現在の為替レート", True)):
+            result, _ = await self.bot.process_message("為替レートの見通しを教えて")
+        
+        assert result == "ドル円は上昇傾向です"
+        self.mock_llm.ainvoke.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_direct_answers_disabled(self):
+        """フラグ無効時は常にLLMで回答を生成することのテスト"""
+        final_response = MagicMock()
+        final_response.content = "LLMの回答"
+        self.mock_llm.ainvoke.return_value = final_response
+        self.bot.direct_tool_answers = False
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("📈 現在の為替レート", True)):
+            result, _ = await self.bot.process_message("為替レートを教えて")
+        
+        assert result == "LLMの回答"
+
+
+    @pytest.mark.asyncio
+    async def test_failed_tool_uses_llm_and_not_cached(self, no_embeddings):
+        """ツールが失敗した場合はLLMで回答を生成し、キャッシュしないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        final_response = MagicMock()
+        final_response.content = "現在レートを取得できません"
+        self.mock_llm.ainvoke.return_value = final_response
+        network_error = "為替データの取得中にネットワークエラーが発生しました。しばらく時間をおいてから再度お試しください。"
+        
+        with patch.object(self.bot, '_execute_tool', return_value=(network_error, False)):
+            result, cacheable = await self.bot.process_message("為替レートを教えて")
+        
+        assert result == "現在レートを取得できません"
+        assert cacheable is False
+        self.mock_llm.ainvoke.assert_called_once()
+        assert self.bot.response_cache.lookup([1.0, 0.0, 0.0]) is None
+
+class TestFunctionCallingChatBotToolDeduplication(BotTestBase):
+    """ツール呼び出しの重複排除のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_duplicate_tool_calls_executed_once(self):
+        """同じツール名・引数の呼び出しが1回だけ実行されることのテスト"""
+        response = AIMessage(content="", tool_calls=[
+            {'name': 'get_specific_exchange_rate', 'args': {'currency_pair': 'USD_JPY'}, 'id': 'call_1'},
+            {'name': 'get_specific_exchange_rate', 'args': {'currency_pair': 'USD_JPY'}, 'id': 'call_2'},
+            {'name': 'get_specific_exchange_rate', 'args': {'currency_pair': 'EUR_JPY'}, 'id': 'call_3'}
+        ])
+        messages = []
+        
+        with patch.object(self.bot, '_execute_tool', side_effect=lambda tool_call: (tool_call['args']['currency_pair'], True)) as mock_execute_tool:
+            await self.bot._append_tool_results(messages, response)
+        
+        assert mock_execute_tool.call_count == 2
+        tool_messages = messages[1:]
+        assert [m.tool_call_id for m in tool_messages] == ['call_1', 'call_2', 'call_3']
+        assert [m.content for m in tool_messages] == ['USD_JPY', 'USD_JPY', 'EUR_JPY']
+
+    @pytest.mark.asyncio
+    async def test_duplicate_tool_calls_answered_once(self):
+        """同じツール呼び出しが重複しても、直接回答にはツール結果が1回だけ含まれることのテスト"""
+        duplicate_calls = [
+            {'name': 'get_exchange_rates', 'args': {}, 'id': 'call_1'},
+            {'name': 'get_exchange_rates', 'args': {}, 'id': 'call_2'}
+        ]
+        self.bot.llm_with_tools = MagicMock()
+        self.bot.llm_with_tools.ainvoke = AsyncMock(return_value=AIMessage(content="", tool_calls=duplicate_calls))
+        
+        async def fake_astream(messages):
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {'name': call['name'], 'args': '{}', 'id': call['id'], 'index': index}
+                for index, call in enumerate(duplicate_calls)
+            ])
+        self.bot.llm_with_tools.astream = fake_astream
+        
+        with patch.object(self.bot, '_execute_tool', return_value=("📈 現在の為替レート", True)):
+            result, _ = await self.bot.process_message("為替レートを教えて")
+            deltas = [delta async for delta in self.bot.stream_message("為替レートを教えて")]
+        
+        assert result == "📈 現在の為替レート"
+        assert deltas == ["📈 現在の為替レート"]
+
+
+class TestFunctionCallingChatBotOutOfScope(BotTestBase):
+    """為替に関係しない質問の定型応答のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup_mocks(self, setup_bot):
+        """LLMなどのモックを設定"""
+        self.mock_llm_with_tools = MagicMock()
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "LLMの回答"
+        self.mock_llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+        self.bot.llm_with_tools = self.mock_llm_with_tools
+
+    @pytest.mark.parametrize("message, expected", [
+        ("ドル円のレートは？", True),
+        ("USD_JPYを教えて", True),
+        ("今日の為替相場", True),
+        ("eur/usd rate", True),
+        ("こんにちは", False),
+        ("おすすめのレシピを教えて", False),
+    ])
+    def test_is_exchange_query(self, message, expected):
+        """為替に関する質問の判定テスト"""
+        assert self.bot._is_exchange_query(message) is expected
+
+    @pytest.mark.asyncio
+    async def test_out_of_scope_skips_llm(self, no_embeddings):
+        """参考情報がなく為替と無関係な質問ではLLMもエンベディングも呼ばないことのテスト"""
+        result, _ = await self.bot.process_message("こんにちは")
+        
+        assert result == OUT_OF_SCOPE_RESPONSE
+        self.mock_llm_with_tools.ainvoke.assert_not_called()
+        no_embeddings.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_out_of_scope_without_search_results(self, no_embeddings):
+        """検索結果がなく為替と無関係な質問では定型応答を返すことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        
+        with patch('api.bot.vector_store_service.is_initialized', return_value=True), \
+             patch('api.bot.vector_store_service.search_documents_by_vector', return_value=[]):
+            result, _ = await self.bot.process_message("こんにちは")
+        
+        assert result == OUT_OF_SCOPE_RESPONSE
+        self.mock_llm_with_tools.ainvoke.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_non_exchange_query_with_context_uses_llm(self, no_embeddings):
+        """参考情報がある場合は為替と無関係な質問でもLLMで回答することのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        document = MagicMock()
+        document.page_content = "ページの内容"
+        
+        with patch('api.bot.vector_store_service.is_initialized', return_value=True), \
+             patch('api.bot.vector_store_service.search_documents_by_vector', return_value=[document]):
+            result, _ = await self.bot.process_message("このページの概要は？")
+        
+        assert result == "LLMの回答"
+
+    @pytest.mark.asyncio
+    async def test_embedding_failure_falls_through_to_llm(self):
+        """エンベディング取得に失敗した場合は定型応答を返さず、キャッシュ不可の回答をLLMで生成することのテスト"""
+        async def fake_astream(messages):
+            yield AIMessageChunk(content="LLMの回答")
+        self.mock_llm_with_tools.astream = fake_astream
+        
+        with patch('api.bot.vector_store_service.is_initialized', return_value=True):
+            result, cacheable = await self.bot.process_message("このページの概要は？")
+            deltas = [delta async for delta in self.bot.stream_message("このページの概要は？")]
+        
+        assert result == "LLMの回答"
+        assert cacheable is False
+        assert deltas == ["LLMの回答"]
+        self.mock_llm_with_tools.ainvoke.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stream_out_of_scope(self):
+        """ストリーミングでも定型応答を返すことのテスト"""
+        deltas = [delta async for delta in self.bot.stream_message("こんにちは")]
+        
+        assert deltas == [OUT_OF_SCOPE_RESPONSE]
+
+
+class TestFunctionCallingChatBotRatesPrefetch(BotTestBase):
+    """為替レートの先読みのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup_mocks(self, setup_bot):
+        """LLMなどのモックを設定"""
+        mock_response = MagicMock()
+        mock_response.tool_calls = []
+        mock_response.content = "LLMの回答"
+        self.bot.llm_with_tools = MagicMock()
+        self.bot.llm_with_tools.ainvoke = AsyncMock(return_value=mock_response)
+
+    @pytest.mark.asyncio
+    async def test_exchange_query_prefetches_rates(self, no_rates_prefetch):
+        """為替の質問ではLLM呼び出しと並行してレートを先読みすることのテスト"""
+        await self.bot.process_message("ドル円のレートは？")
+        await asyncio.gather(*self.bot._background_tasks)
+        
+        no_rates_prefetch.assert_called_once()
+        assert not self.bot._background_tasks
+
+    @pytest.mark.asyncio
+    async def test_out_of_scope_query_not_prefetched(self, no_rates_prefetch):
+        """為替と無関係な質問ではレートを先読みしないことのテスト"""
+        await self.bot.process_message("こんにちは")
+        
+        no_rates_prefetch.assert_not_called()
+        assert not self.bot._background_tasks
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_not_prefetched(self, no_embeddings, no_rates_prefetch):
+        """セマンティックキャッシュにヒットした為替の質問ではレートを先読みしないことのテスト"""
+        no_embeddings.return_value = [1.0, 0.0, 0.0]
+        self.bot.response_cache.store([1.0, 0.0, 0.0], "キャッシュ済みの回答", currency_tag("ドル円のレートは？"))
+        
+        await self.bot.process_message("ドル円のレートは？")
+        deltas = [delta async for delta in self.bot.stream_message("ドル円のレートは？")]
+        
+        assert deltas == ["キャッシュ済みの回答"]
+        no_rates_prefetch.assert_not_called()
+        assert not self.bot._background_tasks
+
+
+class TestFunctionCallingChatBotRequestCoalescing(BotTestBase):
+    """同一メッセージの同時リクエスト共有のテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup_mocks(self, setup_bot):
+        """LLMなどのモックを設定"""
+        self.release = asyncio.Event()
+        
+        async def slow_ainvoke(messages):
+            await self.release.wait()
+            response = MagicMock()
+            response.tool_calls = []
+            response.content = f"回答: {messages[-1].content}"
+            return response
+        
+        self.bot.llm_with_tools = MagicMock()
+        self.bot.llm_with_tools.ainvoke = AsyncMock(side_effect=slow_ainvoke)
+
+    @pytest.mark.asyncio
+    async def test_identical_messages_share_llm_call(self):
+        """処理中の同一メッセージはLLM呼び出しを共有することのテスト"""
+        requests = [asyncio.create_task(self.bot.process_message("ドル円のレートは？")) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        
+        results = await asyncio.gather(*requests)
+        
+        assert [answer for answer, _ in results] == ["回答: ドル円のレートは？"] * 3
+        assert self.bot.llm_with_tools.ainvoke.call_count == 1
+        assert self.bot._pending == {}
+
+    @pytest.mark.asyncio
+    async def test_different_messages_processed_separately(self):
+        """異なるメッセージはそれぞれ処理されることのテスト"""
+        requests = [
+            asyncio.create_task(self.bot.process_message("ドル円のレートは？")),
+            asyncio.create_task(self.bot.process_message("ユーロ円のレートは？")),
+        ]
+        await asyncio.sleep(0)
+        self.release.set()
+        
+        results = await asyncio.gather(*requests)
+        
+        assert [answer for answer, _ in results] == ["回答: ドル円のレートは？", "回答: ユーロ円のレートは？"]
+        assert self.bot.llm_with_tools.ainvoke.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_same_message_with_different_urls_processed_separately(self):
+        """参照中のURLが異なれば同じメッセージでも別々に処理されることのテスト"""
+        with patch('api.bot.vector_store_service.get_current_urls', side_effect=[["https://a.example"], ["https://b.example"]]):
+            requests = [asyncio.create_task(self.bot.process_message("ドル円のレートは？")) for _ in range(2)]
+            await asyncio.sleep(0)
+        self.release.set()
+        
+        await asyncio.gather(*requests)
+        
+        assert self.bot.llm_with_tools.ainvoke.call_count == 2
+        assert self.bot._pending == {}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request_does_not_cancel_others(self):
+        """1つのリクエストがキャンセルされても他のリクエストは回答を受け取ることのテスト"""
+        first = asyncio.create_task(self.bot.process_message("ドル円のレートは？"))
+        second = asyncio.create_task(self.bot.process_message("ドル円のレートは？"))
+        await asyncio.sleep(0)
+        
+        first.cancel()
+        self.release.set()
+        
+        answer, _ = await second
+        assert answer == "回答: ドル円のレートは？"
+        assert first.cancelled()
@@ -4,7 +4,6 @@ Pydanticモデルのユニットテスト
 """
 
 import pytest
-from datetime import datetime
 from pydantic import ValidationError
 from api.models import (
     ChatRequest,
@@ -15,6 +14,12 @@ from api.models import (
 )
 
 
+@pytest.fixture(scope="session")
+def fixed_ts():
+    """テストで共通に使う固定のタイムスタンプ"""
+    return "2024-01-01T00:00:00"
+
+
 class TestChatRequest:
     """ChatRequestモデルのテスト"""
 
@@ -55,36 +60,23 @@ class TestChatRequest:
 class TestChatResponse:
     """ChatResponseモデルのテスト"""
 
-    def test_valid_chat_response(self):
+    def test_valid_chat_response(self, fixed_ts):
         """正常なチャットレスポンスの作成テスト"""
-        timestamp = datetime.now().isoformat()
         response = ChatResponse(
             response="テストレスポンス",
-            timestamp=timestamp
+            timestamp=fixed_ts
         )
         assert response.response == "テストレスポンス"
-        assert response.timestamp == timestamp
+        assert response.timestamp == fixed_ts
 
-    def test_empty_response(self):
+    def test_empty_response(self, fixed_ts):
         """空のレスポンスでの作成テスト"""
-        timestamp = datetime.now().isoformat()
         response = ChatResponse(
             response="",
-            timestamp=timestamp
+            timestamp=fixed_ts
         )
         assert response.response == ""
 
-    def test_missing_fields(self):
-        """必須フィールドが欠けている場合のテスト"""
-        with pytest.raises(ValidationError) as exc_info:
-            ChatResponse()
-        
-        errors = exc_info.value.errors()
-        assert len(errors) == 2
-        error_fields = [error['loc'][0] for error in errors]
-        assert 'response' in error_fields
-        assert 'timestamp' in error_fields
-
     def test_invalid_timestamp_format(self):
         """不正なタイムスタンプ形式でのテスト"""
         # 文字列として渡すので、Pydanticはバリデーションしない
@@ -94,6 +86,15 @@ class TestChatResponse:
         )
         assert response.timestamp == "invalid-timestamp"
 
+    def test_response_is_immutable(self, fixed_ts):
+        """生成済みレスポンスが変更できないことのテスト"""
+        response = ChatResponse(
+            response="テストレスポンス",
+            timestamp=fixed_ts
+        )
+        with pytest.raises(ValidationError):
+            response.response = "変更"
+
 
 class TestToolInfo:
     """ToolInfoモデルのテスト"""
@@ -113,17 +114,6 @@ class TestToolInfo:
         assert tool.name == ""
         assert tool.description == ""
 
-    def test_missing_fields(self):
-        """必須フィールドが欠けている場合のテスト"""
-        with pytest.raises(ValidationError) as exc_info:
-            ToolInfo()
-        
-        errors = exc_info.value.errors()
-        assert len(errors) == 2
-        error_fields = [error['loc'][0] for error in errors]
-        assert 'name' in error_fields
-        assert 'description' in error_fields
-
 
 class TestToolsResponse:
     """ToolsResponseモデルのテスト"""
@@ -175,26 +165,14 @@ class TestHealthResponse:
         assert response.message == "API is running"
         assert response.status == "ok"
 
-    def test_different_status_values(self):
+    @pytest.mark.parametrize("status", ["ok", "error", "warning", "maintenance"])
+    def test_different_status_values(self, status):
         """異なるステータス値でのテスト"""
-        statuses = ["ok", "error", "warning", "maintenance"]
-        for status in statuses:
-            response = HealthResponse(
-                message=f"Status is {status}",
-                status=status
-            )
-            assert response.status == status
-
-    def test_missing_fields(self):
-        """必須フィールドが欠けている場合のテスト"""
-        with pytest.raises(ValidationError) as exc_info:
-            HealthResponse()
-        
-        errors = exc_info.value.errors()
-        assert len(errors) == 2
-        error_fields = [error['loc'][0] for error in errors]
-        assert 'message' in error_fields
-        assert 'status' in error_fields
+        response = HealthResponse(
+            message=f"Status is {status}",
+            status=status
+        )
+        assert response.status == status
 
     def test_model_serialization(self):
         """モデルのシリアライゼーションテスト"""
@@ -211,6 +189,22 @@ class TestHealthResponse:
         }
 
 
+class TestRequiredFields:
+    """必須フィールドのテスト"""
+
+    @pytest.mark.parametrize("model,expected_fields", [
+        (ChatResponse, {"response", "timestamp"}),
+        (ToolInfo, {"name", "description"}),
+        (HealthResponse, {"message", "status"}),
+    ])
+    def test_missing_fields(self, model, expected_fields):
+        """必須フィールドが欠けている場合のテスト"""
+        with pytest.raises(ValidationError) as exc_info:
+            model()
+        
+        assert {error['loc'][0] for error in exc_info.value.errors()} == expected_fields
+
+
 class TestModelIntegration:
     """モデル間の統合テスト"""
 
@@ -0,0 +1,45 @@
+"""
+Redisクライアントのユニットテスト
+REDIS_URLの有無による初期化のテスト
+"""
+
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+from api.redis_store import get_redis, reset_redis
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    """テスト間でRedisクライアントを共有しないようにする"""
+    reset_redis()
+    yield
+    reset_redis()
+
+
+class TestGetRedis:
+    """get_redis関数のテスト"""
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_without_redis_url(self):
+        """REDIS_URL未設定時はNoneを返すことのテスト"""
+        assert get_redis() is None
+
+    @patch.dict(os.environ, {'REDIS_URL': 'redis://localhost:6379/0'})
+    @patch('api.redis_store.redis.Redis.from_url')
+    def test_client_created_once(self, mock_from_url):
+        """クライアントが一度だけ作成され再利用されることのテスト"""
+        mock_client = MagicMock()
+        mock_from_url.return_value = mock_client
+        
+        assert get_redis() is mock_client
+        assert get_redis() is mock_client
+        mock_from_url.assert_called_once()
+
+    @patch.dict(os.environ, {'REDIS_URL': 'invalid://'})
+    @patch('api.redis_store.redis.Redis.from_url')
+    def test_initialization_error(self, mock_from_url):
+        """初期化失敗時はNoneを返すことのテスト"""
+        mock_from_url.side_effect = ValueError("invalid url")
+        
+        assert get_redis() is None
@@ -0,0 +1,117 @@
+"""
+セマンティックレスポンスキャッシュのユニットテスト
+類似度判定と有効期限のテスト
+"""
+
+import numpy as np
+from unittest.mock import patch
+from api.semantic_cache import SemanticResponseCache
+
+
+class TestSemanticResponseCache:
+    """SemanticResponseCacheクラスのテスト"""
+
+    def setup_method(self):
+        """テストメソッドの初期化"""
+        self.cache = SemanticResponseCache(threshold=0.9, ttl=30.0, max_entries=2)
+
+    def test_lookup_empty(self):
+        """空のキャッシュの検索テスト"""
+        assert self.cache.lookup([1.0, 0.0]) is None
+
+    def test_lookup_similar_hit(self):
+        """類似したエンベディングでヒットすることのテスト"""
+        self.cache.store([1.0, 0.0], "回答A")
+        
+        assert self.cache.lookup([0.99, 0.05]) == "回答A"
+
+    def test_lookup_dissimilar_miss(self):
+        """類似度が閾値未満の場合にミスすることのテスト"""
+        self.cache.store([1.0, 0.0], "回答A")
+        
+        assert self.cache.lookup([0.0, 1.0]) is None
+
+    def test_lookup_returns_most_similar(self):
+        """最も類似したエントリが返されることのテスト"""
+        self.cache.store([1.0, 0.0], "回答A")
+        self.cache.store([0.95, 0.3], "回答B")
+        
+        assert self.cache.lookup([0.96, 0.28]) == "回答B"
+
+    def test_lookup_requires_matching_tag(self):
+        """類似度が高くてもタグが異なればミスすることのテスト"""
+        self.cache.store([1.0, 0.0], "ドル円の回答", tag="ドル|円")
+        
+        assert self.cache.lookup([1.0, 0.0], tag="ユーロ|円") is None
+        assert self.cache.lookup([1.0, 0.0], tag="ドル|円") == "ドル円の回答"
+
+    def test_zero_vector_ignored(self):
+        """ゼロベクトルが登録・検索されないことのテスト"""
+        self.cache.store([0.0, 0.0], "回答")
+        
+        assert self.cache.lookup([0.0, 0.0]) is None
+        assert self.cache.lookup([1.0, 0.0]) is None
+
+    def test_ttl_expiry(self):
+        """有効期限切れのエントリがヒットしないことのテスト"""
+        with patch('api.semantic_cache.time.monotonic', return_value=100.0):
+            self.cache.store([1.0, 0.0], "回答A")
+        
+        with patch('api.semantic_cache.time.monotonic', return_value=131.0):
+            assert self.cache.lookup([1.0, 0.0]) is None
+
+    def test_max_entries_evicts_oldest(self):
+        """最大エントリ数を超えると古いエントリから削除されることのテスト"""
+        self.cache.store([1.0, 0.0, 0.0], "回答A")
+        self.cache.store([0.0, 1.0, 0.0], "回答B")
+        self.cache.store([0.0, 0.0, 1.0], "回答C")
+        
+        assert self.cache.lookup([1.0, 0.0, 0.0]) is None
+        assert self.cache.lookup([0.0, 1.0, 0.0]) == "回答B"
+        assert self.cache.lookup([0.0, 0.0, 1.0]) == "回答C"
+
+    def test_entries_quantized_to_int8(self):
+        """登録したエンベディングがint8で保持されることのテスト"""
+        self.cache.store([0.6, 0.8], "回答A")
+        
+        vector = self.cache._matrix[0]
+        assert vector.dtype == np.int8
+        assert vector.tolist() == [76, 102]
+
+    def test_lru_eviction_keeps_recently_used(self):
+        """最近ヒットしたエントリは置き換えられないことのテスト"""
+        self.cache.store([1.0, 0.0, 0.0], "回答A")
+        self.cache.store([0.0, 1.0, 0.0], "回答B")
+        assert self.cache.lookup([1.0, 0.0, 0.0]) == "回答A"
+        
+        self.cache.store([0.0, 0.0, 1.0], "回答C")
+        
+        assert self.cache.lookup([1.0, 0.0, 0.0]) == "回答A"
+        assert self.cache.lookup([0.0, 1.0, 0.0]) is None
+        assert self.cache.lookup([0.0, 0.0, 1.0]) == "回答C"
+
+    def test_expired_slot_reused(self):
+        """満杯時は期限切れのスロットが優先して再利用されることのテスト"""
+        with patch('api.semantic_cache.time.monotonic', return_value=100.0):
+            self.cache.store([1.0, 0.0, 0.0], "回答A")
+        with patch('api.semantic_cache.time.monotonic', return_value=120.0):
+            self.cache.store([0.0, 1.0, 0.0], "回答B")
+        with patch('api.semantic_cache.time.monotonic', return_value=135.0):
+            self.cache.store([0.0, 0.0, 1.0], "回答C")
+            assert self.cache.lookup([0.0, 1.0, 0.0]) == "回答B"
+            assert self.cache.lookup([0.0, 0.0, 1.0]) == "回答C"
+
+    def test_dimension_change_resets(self):
+        """エンベディングの次元が変わった場合に作り直されることのテスト"""
+        self.cache.store([1.0, 0.0], "回答A")
+        self.cache.store([1.0, 0.0, 0.0], "回答B")
+        
+        assert self.cache.lookup([1.0, 0.0]) is None
+        assert self.cache.lookup([1.0, 0.0, 0.0]) == "回答B"
+
+    def test_clear(self):
+        """キャッシュクリアのテスト"""
+        self.cache.store([1.0, 0.0], "回答A")
+        self.cache.clear()
+        
+        assert self.cache.lookup([1.0, 0.0]) is None
@@ -3,168 +3,193 @@
 GMO Coin API呼び出しとレスポンス処理のテスト
 """
 
+import json
 import pytest
 import responses
 import requests
-from datetime import datetime
+from freezegun import freeze_time
 from unittest.mock import patch, MagicMock
-from api.tools import ExchangingTool, get_exchange_rates, get_specific_exchange_rate
+import api.tools
+from api.tools import ExchangeRateError, ExchangingTool, get_exchange_rates, get_specific_exchange_rate
+
+# テストで差し替えるGMOコイン為替APIのエンドポイント
+TICKER_URL = "https://forex-api.coin.z.com/public/v1/ticker"
+
+# テストで共通に使うティッカーAPIのレスポンス（モック応答ごとにエンコードしないよう、読み込み時にJSONバイト列にしておく）
+BASIC_THREE_PAIRS = json.dumps({
+    "status": 0,
+    "data": [
+        {"symbol": "USD_JPY", "bid": "150.123", "ask": "150.126"},
+        {"symbol": "EUR_JPY", "bid": "165.456", "ask": "165.460"},
+        {"symbol": "GBP_JPY", "bid": "190.789", "ask": "190.793"}
+    ]
+}).encode("utf-8")
+
+MAJOR_PAIRS_PAYLOAD = json.dumps({
+    "status": 0,
+    "data": [
+        {"symbol": "USD_JPY", "bid": "150.123", "ask": "150.126"},
+        {"symbol": "EUR_JPY", "bid": "165.456", "ask": "165.460"},
+        {"symbol": "GBP_JPY", "bid": "190.789", "ask": "190.793"},
+        {"symbol": "AUD_JPY", "bid": "98.123", "ask": "98.127"},
+        {"symbol": "EUR_USD", "bid": "1.0845", "ask": "1.0848"},
+        {"symbol": "CHF_JPY", "bid": "168.234", "ask": "168.238"}  # 主要通貨ペアではない
+    ]
+}).encode("utf-8")
+
+USD_ONLY_PAYLOAD = json.dumps({"status": 0, "data": [{"symbol": "USD_JPY", "bid": "150.000", "ask": "150.005"}]}).encode("utf-8")
+
+EMPTY_PAYLOAD = json.dumps({"status": 0, "data": []}).encode("utf-8")
+
+ERROR_STATUS_PAYLOAD = json.dumps({"status": 1, "data": []}).encode("utf-8")
+
+# BASIC_THREE_PAIRSを整形した結果に含まれるべき文字列
+EXPECTED_BASIC = (
+    "📈 現在の為替レート",
+    "ドル/円 (USD_JPY)",
+    "ユーロ/円 (EUR_JPY)",
+    "ポンド/円 (GBP_JPY)",
+    "150.123",
+    "150.126",
+    "⏰ 取得時刻:",
+    "※ レートは参考値です",
+)
+
+# MAJOR_PAIRS_PAYLOADを整形した結果に含まれるべき通貨ペア表記
+EXPECTED_MAJOR_PAIRS = (
+    "ドル/円 (USD_JPY)",
+    "ユーロ/円 (EUR_JPY)",
+    "ポンド/円 (GBP_JPY)",
+    "豪ドル/円 (AUD_JPY)",
+    "ユーロ/ドル (EUR_USD)",
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_rates_cache():
+    """テスト間でティッカーデータのキャッシュを共有しないようにする"""
+    api.tools._RATES_CACHE.clear()
+    yield
+    api.tools._RATES_CACHE.clear()
+
+
+@pytest.fixture(scope="class")
+def rsps():
+    """クラス内で共有するHTTPモック（requestsへのパッチの適用・解除はクラスごとに1回）"""
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as mock:
+        yield mock
+
+
+@pytest.fixture(autouse=True)
+def reset_rsps(rsps):
+    """テストごとに登録したモックレスポンスと呼び出し履歴を消去する"""
+    yield
+    rsps.reset()
+
+
+@pytest.fixture
+def register_ticker(rsps):
+    """ティッカーAPIのモックレスポンスを1行で登録する関数を返す（payloadはdictまたはJSONバイト列）"""
+    def _register(payload=None, status=200, body=None):
+        if body is not None:
+            rsps.add(responses.GET, TICKER_URL, body=body, status=status)
+        elif isinstance(payload, bytes):
+            rsps.add(responses.GET, TICKER_URL, body=payload, content_type="application/json", status=status)
+        else:
+            rsps.add(responses.GET, TICKER_URL, json=payload, status=status)
+    return _register
+
+
+@pytest.fixture
+def frozen():
+    """現在時刻を2024-01-01 12:00:00に固定する（frozen.tick()で時刻を進められる）"""
+    with freeze_time("2024-01-01 12:00:00") as frozen_time:
+        yield frozen_time
+
+
+@pytest.fixture
+def http_session():
+    """ExchangingToolに渡すHTTPセッション"""
+    session = requests.Session()
+    yield session
+    session.close()
+
+
+@pytest.fixture(scope="class")
+def tool():
+    """クラス内で共有するExchangingTool（状態を持たないため使い回せる）"""
+    return ExchangingTool()
 
 
 class TestExchangingTool:
     """ExchangingToolクラスのテスト"""
 
-    def setup_method(self):
-        """各テストメソッドの前に実行される初期化処理"""
-        self.tool = ExchangingTool()
-
-    def test_init(self):
+    def test_init(self, tool):
         """初期化テスト"""
-        assert self.tool.api_url == "https://forex-api.coin.z.com/public/v1/ticker"
-        assert self.tool.description == "為替レート情報を取得するツール"
+        assert tool.api_url == TICKER_URL
+        assert tool.description == "為替レート情報を取得するツール"
+        assert tool.session is api.tools._session
 
-    @responses.activate
-    def test_get_rates_success(self):
+    def test_injected_session_reused(self, http_session, register_ticker, rsps):
+        """渡したHTTPセッションが毎回のAPI呼び出しで使い回されることのテスト"""
+        session_tool = ExchangingTool(session=http_session)
+        register_ticker(payload=USD_ONLY_PAYLOAD)
+        
+        with patch.object(http_session, 'get', wraps=http_session.get) as session_get, \
+             patch.object(api.tools._session, 'get') as shared_get:
+            session_tool.get_rates()
+            api.tools._RATES_CACHE.clear()
+            session_tool.get_specific_rate("USD_JPY")
+        
+        assert session_get.call_count == 2
+        assert len(rsps.calls) == 2
+        shared_get.assert_not_called()
+
+    def test_get_rates_success(self, tool, register_ticker):
         """正常な為替レート取得のテスト"""
         # モックレスポンスを設定
-        mock_response = {
-            "status": 0,
-            "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.123",
-                    "ask": "150.126"
-                },
-                {
-                    "symbol": "EUR_JPY",
-                    "bid": "165.456",
-                    "ask": "165.460"
-                },
-                {
-                    "symbol": "GBP_JPY",
-                    "bid": "190.789",
-                    "ask": "190.793"
-                }
-            ]
-        }
+        register_ticker(payload=BASIC_THREE_PAIRS)
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_rates()
-        
-        # レスポンス内容を確認
-        assert "📈 現在の為替レート" in result
-        assert "ドル/円 (USD_JPY)" in result
-        assert "ユーロ/円 (EUR_JPY)" in result
-        assert "ポンド/円 (GBP_JPY)" in result
-        assert "150.123" in result
-        assert "150.126" in result
-        assert "⏰ 取得時刻:" in result
-        assert "※ レートは参考値です" in result
-
-    @responses.activate
-    def test_get_rates_api_error_status(self):
-        """APIエラーステータスのテスト"""
-        mock_response = {
-            "status": 1,
-            "data": []
-        }
+        result = tool.get_rates()
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
+        # レスポンス内容を確認（欠けている文字列をまとめて表示する）
+        missing = [expected for expected in EXPECTED_BASIC if expected not in result]
+        assert not missing, missing
+
+    def test_get_rates_api_error_status(self, tool, register_ticker):
+        """APIエラーステータスのテスト"""
+        register_ticker(payload=ERROR_STATUS_PAYLOAD)
         
-        result = self.tool.get_rates()
-        assert result == "為替データの取得に失敗しました。"
+        with pytest.raises(ExchangeRateError, match="^為替データの取得に失敗しました。$"):
+            tool.get_rates()
 
-    @responses.activate
-    def test_get_rates_empty_data(self):
+    def test_get_rates_empty_data(self, tool, register_ticker):
         """空のデータが返された場合のテスト"""
-        mock_response = {
-            "status": 0,
-            "data": []
-        }
+        register_ticker(payload=EMPTY_PAYLOAD)
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_rates()
-        assert result == "為替データが見つかりませんでした。"
-
-    @responses.activate
-    def test_get_rates_network_error(self):
-        """ネットワークエラーのテスト"""
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            body=requests.exceptions.ConnectionError("Network error")
-        )
-        
-        result = self.tool.get_rates()
-        assert "為替データの取得中にネットワークエラーが発生しました" in result
-
-    @responses.activate
-    def test_get_rates_http_error(self):
-        """HTTPエラーのテスト"""
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            status=500
-        )
-        
-        result = self.tool.get_rates()
-        assert "為替データの取得中にネットワークエラーが発生しました" in result
-
-    @responses.activate
-    def test_get_rates_timeout(self):
-        """タイムアウトエラーのテスト"""
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            body=requests.exceptions.Timeout("Timeout error")
-        )
-        
-        result = self.tool.get_rates()
-        assert "為替データの取得中にネットワークエラーが発生しました" in result
-
-    @responses.activate
-    def test_get_rates_spread_calculation(self):
+        with pytest.raises(ExchangeRateError, match="^為替データが見つかりませんでした。$"):
+            tool.get_rates()
+
+    @pytest.mark.parametrize("failure", [
+        {"body": requests.exceptions.ConnectionError("Network error")},
+        {"status": 500},
+        {"body": requests.exceptions.Timeout("Timeout error")},
+    ], ids=["network_error", "http_error", "timeout"])
+    def test_get_rates_request_failure(self, tool, register_ticker, failure):
+        """ネットワークエラー・HTTPエラー・タイムアウトのテスト"""
+        register_ticker(**failure)
+        
+        with pytest.raises(ExchangeRateError, match="為替データの取得中にネットワークエラーが発生しました"):
+            tool.get_rates()
+
+    def test_get_rates_spread_calculation(self, tool, register_ticker):
         """スプレッド計算のテスト"""
-        mock_response = {
-            "status": 0,
-            "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.000",
-                    "ask": "150.005"
-                }
-            ]
-        }
+        register_ticker(payload=USD_ONLY_PAYLOAD)
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_rates()
+        result = tool.get_rates()
         assert "スプレッド: 0.0050" in result
 
-    @responses.activate
-    def test_get_rates_invalid_bid_ask(self):
+    def test_get_rates_invalid_bid_ask(self, tool, register_ticker):
         """不正なbid/ask値のテスト"""
         mock_response = {
             "status": 0,
@@ -177,194 +202,114 @@ class TestExchangingTool:
             ]
         }
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
+        register_ticker(payload=mock_response)
         
-        result = self.tool.get_rates()
+        result = tool.get_rates()
         assert "買値: N/A" in result
         assert "売値: N/A" in result
         assert "スプレッド:" not in result  # スプレッドは計算されない
 
-    @responses.activate
-    def test_get_specific_rate_success(self):
-        """特定通貨ペア取得の正常テスト"""
+    def test_get_rates_major_pairs_order(self, tool, register_ticker):
+        """主要通貨ペアが固定の順序で表示され、それ以外は除外されることのテスト"""
         mock_response = {
             "status": 0,
             "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.123",
-                    "ask": "150.126"
-                },
-                {
-                    "symbol": "EUR_JPY",
-                    "bid": "165.456",
-                    "ask": "165.460"
-                }
+                {"symbol": "EUR_USD", "bid": "1.0850", "ask": "1.0852"},
+                {"symbol": "ZAR_JPY", "bid": "8.100", "ask": "8.120"},
+                {"symbol": "USD_JPY", "bid": "150.000", "ask": "150.005"}
             ]
         }
-        
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_specific_rate("USD_JPY")
-        
-        assert "💱 USD_JPY" in result
-        assert "買値: 150.123" in result
-        assert "売値: 150.126" in result
-        assert "取得時刻:" in result
 
-    @responses.activate
-    def test_get_specific_rate_lowercase_input(self):
-        """小文字入力での特定通貨ペア取得テスト"""
-        mock_response = {
-            "status": 0,
-            "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.123",
-                    "ask": "150.126"
-                }
-            ]
-        }
-        
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_specific_rate("usd_jpy")
-        assert "💱 usd_jpy" in result
-        assert "買値: 150.123" in result
+        register_ticker(payload=mock_response)
 
-    @responses.activate
-    def test_get_specific_rate_not_found(self):
-        """存在しない通貨ペアの取得テスト"""
-        mock_response = {
-            "status": 0,
-            "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.123",
-                    "ask": "150.126"
-                }
-            ]
-        }
-        
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_specific_rate("XYZ_ABC")
-        assert "通貨ペア 'XYZ_ABC' が見つかりませんでした。" in result
+        result = tool.get_rates()
+        assert result.index("USD_JPY") < result.index("EUR_USD")
+        assert "ZAR_JPY" not in result
 
-    @responses.activate
-    def test_get_specific_rate_api_error(self):
-        """特定通貨ペア取得でのAPIエラーテスト"""
-        mock_response = {
-            "status": 1,
-            "data": []
-        }
-        
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_specific_rate("USD_JPY")
-        assert "USD_JPYのデータ取得に失敗しました。" in result
-
-    @responses.activate
-    def test_get_specific_rate_exception(self):
-        """特定通貨ペア取得での例外テスト"""
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            body=Exception("Unexpected error")
-        )
-        
-        result = self.tool.get_specific_rate("USD_JPY")
-        assert "USD_JPYのレート取得中にエラーが発生しました。" in result
-
-    @patch('api.tools.datetime')
-    @responses.activate
-    def test_timestamp_format(self, mock_datetime):
+    @pytest.mark.parametrize("mock_setup,currency_pair,expected", [
+        ({"payload": BASIC_THREE_PAIRS}, "USD_JPY", ("💱 USD_JPY", "買値: 150.123", "売値: 150.126", "取得時刻:")),
+        ({"payload": BASIC_THREE_PAIRS}, "usd_jpy", ("💱 usd_jpy", "買値: 150.123")),
+        ({"payload": BASIC_THREE_PAIRS}, "XYZ_ABC", ("通貨ペア 'XYZ_ABC' が見つかりませんでした。",)),
+    ], ids=["success", "lowercase_input", "not_found"])
+    def test_get_specific_rate(self, tool, register_ticker, mock_setup, currency_pair, expected):
+        """特定通貨ペア取得のテスト（正常・小文字入力・該当なし）"""
+        register_ticker(**mock_setup)
+        
+        result = tool.get_specific_rate(currency_pair)
+        
+        missing = [text for text in expected if text not in result]
+        assert not missing, missing
+
+    @pytest.mark.parametrize("mock_setup,expected", [
+        ({"payload": ERROR_STATUS_PAYLOAD}, "^USD_JPYのデータ取得に失敗しました。$"),
+        ({"body": Exception("Unexpected error")}, "^USD_JPYのレート取得中にエラーが発生しました。$"),
+    ], ids=["api_error", "exception"])
+    def test_get_specific_rate_failure(self, tool, register_ticker, mock_setup, expected):
+        """特定通貨ペア取得の失敗時に例外が送出されることのテスト（APIエラー・例外）"""
+        register_ticker(**mock_setup)
+        
+        with pytest.raises(ExchangeRateError, match=expected):
+            tool.get_specific_rate("USD_JPY")
+
+    def test_timestamp_format(self, tool, register_ticker, frozen):
         """タイムスタンプフォーマットのテスト"""
-        # 固定された日時をモック
-        fixed_time = datetime(2024, 1, 1, 12, 0, 0)
-        mock_datetime.now.return_value = fixed_time
-        mock_datetime.strftime = datetime.strftime
-        
-        mock_response = {
-            "status": 0,
-            "data": [
-                {
-                    "symbol": "USD_JPY",
-                    "bid": "150.000",
-                    "ask": "150.005"
-                }
-            ]
-        }
+        register_ticker(payload=USD_ONLY_PAYLOAD)
         
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
-        
-        result = self.tool.get_rates()
+        result = tool.get_rates()
         assert "⏰ 取得時刻: 2024-01-01 12:00:00" in result
 
 
+class _StubTool:
+    """ExchangingToolの代わりに固定の文字列を返し、呼び出しを記録するスタブ"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_rates(self):
+        self.calls.append(("get_rates",))
+        return "モックレート情報"
+
+    def get_specific_rate(self, currency_pair):
+        self.calls.append(("get_specific_rate", currency_pair))
+        return "モック特定レート情報"
+
+
 class TestLangChainToolFunctions:
     """LangChainツール形式の関数テスト"""
 
-    @patch('api.tools.ExchangingTool')
-    def test_get_exchange_rates_function(self, mock_tool_class):
+    def test_get_exchange_rates_function(self, monkeypatch):
         """get_exchange_rates関数のテスト"""
-        # モックインスタンスを設定
-        mock_instance = MagicMock()
-        mock_instance.get_rates.return_value = "モックレート情報"
-        mock_tool_class.return_value = mock_instance
+        # スタブインスタンスに差し替える
+        stub = _StubTool()
+        monkeypatch.setattr(api.tools, "exchanging_tool", stub)
         
         result = get_exchange_rates.invoke({})
         
-        # ExchangingToolが呼び出されたことを確認
-        mock_tool_class.assert_called_once()
-        mock_instance.get_rates.assert_called_once()
+        # 共有のExchangingToolが呼び出されたことを確認
+        assert stub.calls == [("get_rates",)]
         assert result == "モックレート情報"
 
-    @patch('api.tools.ExchangingTool')
-    def test_get_specific_exchange_rate_function(self, mock_tool_class):
+    def test_get_specific_exchange_rate_function(self, monkeypatch):
         """get_specific_exchange_rate関数のテスト"""
-        # モックインスタンスを設定
-        mock_instance = MagicMock()
-        mock_instance.get_specific_rate.return_value = "モック特定レート情報"
-        mock_tool_class.return_value = mock_instance
+        # スタブインスタンスに差し替える
+        stub = _StubTool()
+        monkeypatch.setattr(api.tools, "exchanging_tool", stub)
         
         result = get_specific_exchange_rate.invoke({"currency_pair": "USD_JPY"})
         
-        # ExchangingToolが呼び出されたことを確認
-        mock_tool_class.assert_called_once()
-        mock_instance.get_specific_rate.assert_called_once_with("USD_JPY")
+        # 共有のExchangingToolが呼び出されたことを確認
+        assert stub.calls == [("get_specific_rate", "USD_JPY")]
         assert result == "モック特定レート情報"
 
+    def test_tool_instance_is_shared(self):
+        """ツール関数がモジュール共有のインスタンスを使うことのテスト"""
+        with patch('api.tools.ExchangingTool') as mock_tool_class, \
+             patch.object(api.tools.exchanging_tool, 'get_rates', return_value="レート"):
+            get_exchange_rates.invoke({})
+            get_exchange_rates.invoke({})
+        
+        mock_tool_class.assert_not_called()
+
     def test_langchain_tool_decorators(self):
         """LangChainツールデコレータの確認"""
         # get_exchange_ratesがツール化されていることを確認
@@ -378,70 +323,159 @@ class TestLangChainToolFunctions:
         # ツールの説明が適切に設定されていることを確認
         assert "GMO Coin API" in get_exchange_rates.description
         assert "特定の通貨ペア" in get_specific_exchange_rate.description
+        
+        # 整形済みの結果をそのまま回答に使えることを確認
+        assert get_exchange_rates.return_direct is True
+        assert get_specific_exchange_rate.return_direct is True
 
 
+@pytest.mark.integration
 class TestIntegrationTests:
     """統合テスト"""
 
-    def setup_method(self):
-        """テストメソッドの初期化"""
-        self.tool = ExchangingTool()
-
-    @responses.activate
-    def test_full_workflow_major_pairs(self):
+    def test_full_workflow_major_pairs(self, tool, register_ticker):
         """主要通貨ペアの完全なワークフローテスト"""
-        mock_response = {
-            "status": 0,
-            "data": [
-                {"symbol": "USD_JPY", "bid": "150.123", "ask": "150.126"},
-                {"symbol": "EUR_JPY", "bid": "165.456", "ask": "165.460"},
-                {"symbol": "GBP_JPY", "bid": "190.789", "ask": "190.793"},
-                {"symbol": "AUD_JPY", "bid": "98.123", "ask": "98.127"},
-                {"symbol": "EUR_USD", "bid": "1.0845", "ask": "1.0848"},
-                {"symbol": "CHF_JPY", "bid": "168.234", "ask": "168.238"}  # 主要通貨ペアではない
-            ]
-        }
-        
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json=mock_response,
-            status=200
-        )
+        register_ticker(payload=MAJOR_PAIRS_PAYLOAD)
         
-        result = self.tool.get_rates()
+        result = tool.get_rates()
         
         # 主要通貨ペアが含まれていることを確認
-        assert "ドル/円 (USD_JPY)" in result
-        assert "ユーロ/円 (EUR_JPY)" in result
-        assert "ポンド/円 (GBP_JPY)" in result
-        assert "豪ドル/円 (AUD_JPY)" in result
-        assert "ユーロ/ドル (EUR_USD)" in result
+        missing = [expected for expected in EXPECTED_MAJOR_PAIRS if expected not in result]
+        assert not missing, missing
         
         # 主要通貨ペア以外は含まれていないことを確認
         assert "CHF_JPY" not in result
 
-    @responses.activate
-    def test_error_handling_chain(self):
-        """エラーハンドリングのチェーンテスト"""
-        # 最初のリクエストは失敗
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            body=requests.exceptions.ConnectionError("Network error"),
-            status=500
-        )
-        
-        result1 = self.tool.get_rates()
-        assert "ネットワークエラー" in result1
-        
-        # 2回目のリクエストは成功
-        responses.add(
-            responses.GET,
-            "https://forex-api.coin.z.com/public/v1/ticker",
-            json={"status": 0, "data": [{"symbol": "USD_JPY", "bid": "150.000", "ask": "150.005"}]},
-            status=200
-        )
-        
-        result2 = self.tool.get_rates()
-        assert "ドル/円" in result2
\ No newline at end of file
+    def test_error_handling(self, tool, register_ticker):
+        """失敗時は例外、続く成功時は整形済みのレートが返ることのテスト"""
+        register_ticker(body=requests.exceptions.ConnectionError("Network error"), status=500)
+        with pytest.raises(ExchangeRateError, match="ネットワークエラー"):
+            tool.get_rates()
+        
+        register_ticker(payload=USD_ONLY_PAYLOAD)
+        assert "ドル/円" in tool.get_rates()
+
+
+class TestPrefetchRates:
+    """為替レート先読みのテスト"""
+
+    def test_prefetch_populates_cache(self, register_ticker):
+        """先読みでキャッシュが作成されることのテスト"""
+        register_ticker(payload=USD_ONLY_PAYLOAD)
+        
+        api.tools.prefetch_rates()
+        
+        assert TICKER_URL in api.tools._RATES_CACHE
+
+    def test_prefetch_error_is_ignored(self, register_ticker):
+        """先読み失敗時に例外が送出されないことのテスト"""
+        register_ticker(body=requests.exceptions.ConnectionError("Network error"))
+        
+        api.tools.prefetch_rates()
+        
+        assert api.tools._RATES_CACHE == {}
+
+
+class TestRatesCache:
+    """ティッカーデータキャッシュのテスト"""
+
+    def test_cache_reused_within_ttl(self, tool, register_ticker, rsps):
+        """TTL内の呼び出しでAPIが再度呼ばれないことのテスト"""
+        register_ticker(payload=USD_ONLY_PAYLOAD)
+        
+        result1 = tool.get_rates()
+        result2 = tool.get_specific_rate("USD_JPY")
+        
+        assert "ドル/円" in result1
+        assert "買値: 150.000" in result2
+        assert len(rsps.calls) == 1
+
+    def test_cache_expired_after_ttl(self, tool, register_ticker, rsps):
+        """TTL経過後はAPIが再度呼ばれることのテスト"""
+        register_ticker(payload=USD_ONLY_PAYLOAD)
+        
+        with patch('api.tools.time.monotonic', return_value=100.0):
+            tool.get_rates()
+        with patch('api.tools.time.monotonic', return_value=100.0 + api.tools.RATES_CACHE_TTL):
+            tool.get_rates()
+        
+        assert len(rsps.calls) == 2
+
+    def test_error_status_not_cached(self, tool, register_ticker, rsps):
+        """エラーステータスのレスポンスがキャッシュされないことのテスト"""
+        register_ticker(payload=ERROR_STATUS_PAYLOAD)
+        
+        for _ in range(2):
+            with pytest.raises(ExchangeRateError):
+                tool.get_rates()
+        
+        assert len(rsps.calls) == 2
+
+
+class TestSharedRatesCache:
+    """Redisによるティッカーデータ共有のテスト"""
+
+    @staticmethod
+    def _mock_redis(raw=None, remaining_ms=-2):
+        """pipeline().get().pttl().execute()が指定値を返すRedisモック"""
+        mock_client = MagicMock()
+        mock_client.pipeline.return_value.get.return_value.pttl.return_value.execute.return_value = [raw, remaining_ms]
+        return mock_client
+
+    def test_fetched_rates_stored_in_redis(self, register_ticker):
+        """APIから取得したデータがRedisに保存されることのテスト"""
+        mock_client = self._mock_redis()
+        register_ticker(payload=EMPTY_PAYLOAD)
+        
+        with patch('api.tools.get_redis', return_value=mock_client):
+            api.tools._fetch_rates(TICKER_URL)
+        
+        mock_client.set.assert_called_once()
+        args, kwargs = mock_client.set.call_args
+        assert args[0] == "fx:ticker:" + TICKER_URL
+        assert kwargs == {'px': 2000}
+
+    def test_shared_rates_skip_api_call(self, rsps):
+        """Redisにデータがある場合はAPIを呼び出さないことのテスト"""
+        raw = b'{"status": 0, "data": [{"symbol": "USD_JPY", "bid": "150.000", "ask": "150.005"}]}'
+        mock_client = self._mock_redis(raw, 1500)
+        
+        with patch('api.tools.get_redis', return_value=mock_client):
+            data, by_symbol = api.tools._fetch_rates(TICKER_URL)
+        
+        assert len(rsps.calls) == 0
+        assert by_symbol["USD_JPY"]["bid"] == "150.000"
+        assert TICKER_URL in api.tools._RATES_CACHE
+
+    def test_redis_error_falls_back_to_api(self, register_ticker, rsps):
+        """Redisエラー時はAPIから取得することのテスト"""
+        mock_client = MagicMock()
+        mock_client.pipeline.side_effect = Exception("connection refused")
+        mock_client.set.side_effect = Exception("connection refused")
+        register_ticker(payload=EMPTY_PAYLOAD)
+        
+        with patch('api.tools.get_redis', return_value=mock_client):
+            data, _ = api.tools._fetch_rates(TICKER_URL)
+        
+        assert data["status"] == 0
+        assert len(rsps.calls) == 1
+
+
+class TestFormattedNow:
+    """取得時刻の表示文字列のテスト"""
+
+    def test_same_second_reuses_value(self, frozen):
+        """同じ秒の間は同じ文字列が返されることのテスト"""
+        first = api.tools._formatted_now()
+        frozen.tick(0.5)
+        second = api.tools._formatted_now()
+        
+        assert first is second
+
+    def test_next_second_updates_value(self, frozen):
+        """秒が変わると新しい文字列が返されることのテスト"""
+        first = api.tools._formatted_now()
+        frozen.tick(1)
+        second = api.tools._formatted_now()
+        
+        assert (first, second) == ("2024-01-01 12:00:00", "2024-01-01 12:00:01")
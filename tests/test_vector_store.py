@@ -0,0 +1,286 @@
+"""
+ベクトルストアサービスのユニットテスト
+エンベディング取得とキャッシュのテスト
+"""
+
+import threading
+import responses
+from unittest.mock import patch, MagicMock
+import api.vector_store
+from langchain_core.documents import Document
+from api.vector_store import MatrixVectorStore, VectorStoreService, parse_html_document, split_documents, split_text
+
+
+class TestEmbedQuery:
+    """embed_queryメソッドのテスト"""
+
+    def setup_method(self):
+        """テストメソッドの初期化"""
+        self.service = VectorStoreService()
+        self.mock_embeddings = MagicMock()
+        self.mock_embeddings.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+        self.service.embeddings = self.mock_embeddings
+
+    def test_identical_text_embedded_once(self):
+        """同一テキストのエンベディングAPI呼び出しが1回で済むことのテスト"""
+        first = self.service.embed_query("ドル円のレートは？")
+        second = self.service.embed_query("ドル円のレートは？")
+        
+        assert first == second
+        self.mock_embeddings.embed_query.assert_called_once_with("ドル円のレートは？")
+
+    def test_different_text_embedded_separately(self):
+        """異なるテキストはそれぞれエンベディングされることのテスト"""
+        self.service.embed_query("ドル円")
+        self.service.embed_query("ユーロ円")
+        
+        assert self.mock_embeddings.embed_query.call_count == 2
+
+    def test_error_not_cached(self):
+        """取得失敗時はNoneを返し、キャッシュしないことのテスト"""
+        self.mock_embeddings.embed_query.side_effect = [Exception("API error"), [1.0, 0.0]]
+        
+        assert self.service.embed_query("ドル円") is None
+        assert self.service.embed_query("ドル円") == [1.0, 0.0]
+
+    def test_cache_evicts_least_recently_used(self):
+        """最大件数を超えると最も古く使われたエントリが削除されることのテスト"""
+        with patch.object(api.vector_store, 'EMBEDDING_CACHE_SIZE', 2):
+            self.service.embed_query("A")
+            self.service.embed_query("B")
+            self.service.embed_query("A")
+            self.service.embed_query("C")
+            self.service.embed_query("A")
+            self.service.embed_query("B")
+        
+        # "A","B","C" と、追い出された "B" の再取得で計4回
+        assert self.mock_embeddings.embed_query.call_count == 4
+
+
+class TestLoadAndStoreDocuments:
+    """load_and_store_documentsメソッドのテスト"""
+
+    def setup_method(self):
+        """テストメソッドの初期化"""
+        self.service = VectorStoreService()
+        self.mock_embeddings = MagicMock()
+        self.mock_embeddings.embed_documents.side_effect = lambda texts: [[float(len(text)), 1.0] for text in texts]
+        self.service.embeddings = self.mock_embeddings
+
+    @staticmethod
+    def _register_pages(contents):
+        """URLごとに指定した本文のHTML（または例外）を返すようにモックを登録"""
+        for url, content in contents.items():
+            if isinstance(content, Exception):
+                responses.add(responses.GET, url, body=content)
+            else:
+                responses.add(responses.GET, url, body=f"<html><body>{content}</body></html>", content_type="text/html")
+
+    @responses.activate
+    def test_partial_failure_keeps_url_order(self):
+        """成功・失敗したURLが入力順で返されることのテスト"""
+        contents = {
+            "https://a.example": "ページA",
+            "https://b.example": Exception("connection error"),
+            "https://c.example": "ページC",
+            "https://d.example": "   ",
+        }
+        
+        self._register_pages(contents)
+        successful, failed = self.service.load_and_store_documents(list(contents))
+        
+        assert successful == ["https://a.example", "https://c.example"]
+        assert failed == ["https://b.example", "https://d.example"]
+        assert self.service.get_current_urls() == successful
+
+    @responses.activate
+    def test_embeddings_batched(self):
+        """エンベディングがバッチ単位で呼び出され、再エンベディングされないことのテスト"""
+        contents = {f"https://{i}.example": f"ページ{i}" for i in range(5)}
+        
+        self._register_pages(contents)
+        
+        with patch.object(api.vector_store, 'EMBEDDING_BATCH_SIZE', 2):
+            self.service.load_and_store_documents(list(contents))
+        
+        batch_sizes = sorted(len(call.args[0]) for call in self.mock_embeddings.embed_documents.call_args_list)
+        assert batch_sizes == [1, 2, 2]
+        
+        assert len(self.service.vector_store) == 5
+        results = self.service.search_documents_by_vector([4.0, 1.0], k=5)
+        assert sorted(document.page_content for document in results) == [f"ページ{i}" for i in range(5)]
+        assert self.mock_embeddings.embed_query.call_count == 0
+
+    @responses.activate
+    def test_embedding_overlaps_loading(self):
+        """読み込み済みURLのエンベディングが他のURLの取得完了を待たずに始まることのテスト"""
+        embedding_started = threading.Event()
+        
+        def embed_documents(texts):
+            embedding_started.set()
+            return [[float(len(text)), 1.0] for text in texts]
+        
+        def slow_page(request):
+            # 先に読み込んだURLのエンベディングが始まるまで取得を完了させない
+            body = "<html><body>遅いページ</body></html>" if embedding_started.wait(timeout=5) else ""
+            return 200, {}, body
+        
+        self.mock_embeddings.embed_documents.side_effect = embed_documents
+        responses.add_callback(responses.GET, "https://slow.example", callback=slow_page)
+        self._register_pages({"https://fast.example": "速いページ"})
+        
+        with patch.object(api.vector_store, 'EMBEDDING_BATCH_SIZE', 1):
+            successful, failed = self.service.load_and_store_documents(["https://slow.example", "https://fast.example"])
+        
+        assert successful == ["https://slow.example", "https://fast.example"]
+        assert failed == []
+        assert len(self.service.vector_store) == 2
+
+    @responses.activate
+    def test_embedding_error_fails_all_urls(self):
+        """エンベディング失敗時は全URLを失敗として扱うことのテスト"""
+        contents = {"https://a.example": "ページA", "https://b.example": "ページB"}
+        self.mock_embeddings.embed_documents.side_effect = Exception("API error")
+        self._register_pages(contents)
+        
+        successful, failed = self.service.load_and_store_documents(list(contents))
+        
+        assert successful == []
+        assert failed == list(contents)
+        assert self.service.vector_store is None
+
+    @responses.activate
+    def test_browser_headers_sent(self):
+        """HTML取得時にブラウザのUser-Agentなどの既定ヘッダーが送られることのテスト"""
+        self._register_pages({"https://a.example": "ページA"})
+        
+        self.service.load_and_store_documents(["https://a.example"])
+        
+        headers = responses.calls[0].request.headers
+        assert headers["User-Agent"] == api.vector_store.FETCH_HEADERS["User-Agent"]
+        assert not headers["User-Agent"].startswith("python-requests")
+        assert headers["Accept"].startswith("text/html")
+        assert headers["Accept-Language"] == api.vector_store.FETCH_HEADERS["Accept-Language"]
+
+    @responses.activate
+    def test_search_by_vector_after_load(self):
+        """格納したドキュメントをエンベディングで検索できることのテスト"""
+        contents = {"https://a.example": "ページA"}
+        
+        self._register_pages(contents)
+        self.service.load_and_store_documents(list(contents))
+        
+        results = self.service.search_documents_by_vector([3.0, 1.0], k=1)
+        assert [document.page_content for document in results] == ["ページA"]
+
+
+class TestParseHtmlDocument:
+    """parse_html_document関数のテスト"""
+
+    def test_text_and_metadata(self):
+        """本文テキストとWebBaseLoader互換のメタデータが抽出されることのテスト"""
+        html = (
+            '<html lang="ja"><head><meta charset="utf-8"><title>タイトル</title>'
+            '<meta name="description" content="説明"></head><body><p>本文</p></body></html>'
+        ).encode("utf-8")
+        
+        document = parse_html_document(html, "https://a.example")
+        
+        assert document.page_content.strip() == "タイトル本文"
+        assert document.metadata == {
+            "source": "https://a.example",
+            "title": "タイトル",
+            "description": "説明",
+            "language": "ja",
+        }
+
+    def test_charset_detected_from_meta(self):
+        """metaタグの文字コード指定に従ってデコードされることのテスト"""
+        html = '<html><head><meta charset="shift_jis"></head><body>日本語</body></html>'.encode("shift_jis")
+        
+        assert parse_html_document(html, "https://a.example").page_content == "日本語"
+
+
+class TestMatrixVectorStore:
+    """MatrixVectorStoreクラスのテスト"""
+
+    def setup_method(self):
+        """テストメソッドの初期化"""
+        self.documents = [
+            Document(page_content="東", metadata={"source": "a"}),
+            Document(page_content="北", metadata={"source": "b"}),
+            Document(page_content="北東", metadata={"source": "c"}),
+        ]
+        self.store = MatrixVectorStore(self.documents, [[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]])
+
+    def test_results_ordered_by_similarity(self):
+        """類似度の高い順に返されることのテスト"""
+        results = self.store.similarity_search_by_vector([0.9, 0.1], k=3)
+        
+        assert [document.page_content for document in results] == ["東", "北東", "北"]
+        assert results[0].metadata == {"source": "a"}
+
+    def test_k_larger_than_store(self):
+        """kが格納数より大きい場合は全件を返すことのテスト"""
+        assert len(self.store.similarity_search_by_vector([0.0, 1.0], k=10)) == 3
+
+    def test_zero_query_returns_empty(self):
+        """ゼロベクトルでの検索は空を返すことのテスト"""
+        assert self.store.similarity_search_by_vector([0.0, 0.0], k=2) == []
+
+
+class TestSplitText:
+    """split_text・split_documents関数のテスト"""
+
+    def test_short_text_single_chunk(self):
+        """チャンクサイズ以下のテキストは分割されないことのテスト"""
+        assert split_text("  短いテキスト  ") == ["短いテキスト"]
+
+    def test_empty_text(self):
+        """空白のみのテキストはチャンクを生成しないことのテスト"""
+        assert split_text("") == []
+        assert split_text(" \n\n ") == []
+
+    def test_prefers_paragraph_boundary(self):
+        """段落区切りが窓内にあればそこで分割されることのテスト"""
+        text = "a" * 30 + "\n\n" + "b c " * 10
+        
+        chunks = split_text(text, chunk_size=50, chunk_overlap=0)
+        
+        assert chunks[0] == "a" * 30
+        assert all(len(chunk) <= 50 for chunk in chunks)
+
+    def test_overlap_starts_at_word_boundary(self):
+        """重複部分が単語の先頭から始まることのテスト"""
+        text = " ".join(f"w{i:02d}" for i in range(40))
+        
+        chunks = split_text(text, chunk_size=40, chunk_overlap=10)
+        
+        assert all(len(chunk) <= 40 for chunk in chunks)
+        for previous, current in zip(chunks, chunks[1:]):
+            first_word = current.split(" ")[0]
+            assert first_word in previous.split(" ")
+
+    def test_text_without_separator(self):
+        """区切り文字がないテキストはチャンクサイズで切られ、文字数で重複することのテスト"""
+        assert [len(chunk) for chunk in split_text("x" * 2500)] == [1000, 1000, 700]
+
+    def test_overlap_without_separator_in_cjk_text(self):
+        """区切り文字のない日本語テキストでも重複部分が保たれることのテスト"""
+        text = "".join(chr(ord("あ") + i % 80) for i in range(100))
+        
+        chunks = split_text(text, chunk_size=40, chunk_overlap=10)
+        
+        assert chunks == [text[0:40], text[30:70], text[60:100]]
+        for previous, current in zip(chunks, chunks[1:]):
+            assert current[:10] == previous[-10:]
+
+    def test_split_documents_keeps_metadata(self):
+        """分割後の各チャンクにメタデータが引き継がれることのテスト"""
+        document = Document(page_content="a" * 900 + "\n" + "b" * 900, metadata={"source": "a"})
+        
+        chunks = split_documents([document])
+        
+        assert [chunk.page_content for chunk in chunks] == split_text(document.page_content)
+        assert len(chunks) > 1
+        assert all(chunk.metadata == {"source": "a"} for chunk in chunks)